@@ -33,6 +33,7 @@ setup(
     entry_points= {
     'console_scripts': [
     'dambuilder = dambuilder.main:main',
+    'dambuilder-headless = dambuilder.headless:main',
     ]
     },
 )
@@ -2,6 +2,7 @@ import pygame
 from pygame.locals import *
 
 from dambuilder.load import load
+from dambuilder.clock import wall_clock
 
 class Animation(object):
     def __init__(self, images, t, x_offset, y_offset, facing, updown=1):
@@ -34,16 +35,18 @@ class Animation(object):
         self.y_offset = y_offset
         self.frame_length = t / len(images)
         self._start = None
+        self._clock = wall_clock
         self.facing = facing
         self.updown = updown
         
-    def start(self):
-        self._start = pygame.time.get_ticks()
+    def start(self, clock=wall_clock):
+        self._clock = clock
+        self._start = clock.get_ticks()
 
     def show(self, surface, coordinates):
         """Show animation on surface at coordinates.
         """
-        current = pygame.time.get_ticks() - self._start
+        current = self._clock.get_ticks() - self._start
         current = current % self.t
         image = self.images[int(current / self.frame_length)]
         x, y = coordinates
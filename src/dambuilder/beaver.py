@@ -3,7 +3,6 @@ import pygame
 from dambuilder import living, anim
 from dambuilder.input import player_input
 from dambuilder.view import coord, conv, set_view
-from dambuilder.item import Item
 from dambuilder.living import ILLEGAL, WALKING, WADING, SWIMMING, FLYING
 from dambuilder.material import SECTION_HEIGHT
 from dambuilder.constants import (JUMP_FORCE, CLIMB_Y_FORCE, SWIM_Y_FORCE,
@@ -17,8 +16,11 @@ from dambuilder.load import load_sound
 
 class Beaver(living.Living):
 
-    def __init__(self, geom):
-        super(Beaver, self).__init__(geom, 1, 1.5)
+    # the view follows the beaver, so it's never far away
+    can_sleep = False
+
+    def __init__(self, geom, clock):
+        super(Beaver, self).__init__(geom, 1, 1.5, clock)
         
         self._selected_material = WOOD
         self._worth = 25
@@ -29,20 +31,34 @@ class Beaver(living.Living):
             METAL: 1,
             }
         
-        self._cycle_timeout = living.Timeout(CYCLE_TIMEOUT)
-        self._build_timeout = living.Timeout(BUILD_TIMEOUT)
-        self._buy_timeout = living.Timeout(BUY_TIMEOUT)
-        self._beep_timeout = living.Timeout(300)
-        self._nano_timeout = living.Timeout(6000)
+        self._cycle_timeout = living.Timeout(CYCLE_TIMEOUT, clock)
+        self._build_timeout = living.Timeout(BUILD_TIMEOUT, clock)
+        self._buy_timeout = living.Timeout(BUY_TIMEOUT, clock)
+        self._beep_timeout = living.Timeout(300, clock)
+        self._nano_timeout = living.Timeout(6000, clock)
+
+        # items we touched since the last step
+        self._touched_items = []
+
+    def get_timeouts(self):
+        return [self._cycle_timeout, self._build_timeout, self._buy_timeout,
+                self._beep_timeout, self._nano_timeout]
+
+    def touch_item(self, item):
+        """Collision handler for items, which we pick up.
+        """
+        self._touched_items.append(item)
         
     def behavior(self, stepsize, world):
-        if self._collisions:
-            for obj in self._collisions:
-                if isinstance(obj, Item):
-                    snd = load_sound('25880_acclivity_FingerPlop4.wav')
-                    snd.play()
-                    self._worth += obj.worth
-                    world.remove_item(obj)
+        if self._touched_items:
+            for item in self._touched_items:
+                # we may have touched it more than once
+                if not world.remove_item(item):
+                    continue
+                snd = load_sound('25880_acclivity_FingerPlop4.wav')
+                snd.play()
+                self._worth += item.worth
+            self._touched_items = []
                     
         # cycle material choice
         if player_input.action3:
@@ -0,0 +1,55 @@
+import sys
+import time
+import random
+
+import ode
+
+from dambuilder import physbody
+from dambuilder.physbody import (Ball, Immovable, set_category,
+                                 BEAVER, CREATURE, ITEM, STATIC, RIGHTMOST,
+                                 SIMPLE, HASH, QUADTREE)
+from dambuilder.view import player_view
+from dambuilder.material import SECTION_HEIGHT
+from dambuilder.constants import MAX_X
+
+def benchmark_broadphase(count=200, steps=100, kinds=(SIMPLE, HASH, QUADTREE)):
+    """Report pairs and collide time for each kind of broadphase space.
+
+    count balls are spread over the playing field, a mix of items and
+    creatures, next to the static geometry of the game.
+    """
+    static = [ode.GeomPlane(physbody.static_space, (0, 1, 0), 0),
+              ode.GeomPlane(physbody.static_space, (1, 0, 0), 0),
+              Immovable(6., 4 * SECTION_HEIGHT, 1., 8 * SECTION_HEIGHT),
+              Immovable(MAX_X, 50000., 1., 100000., RIGHTMOST)]
+    for geom in static[:2]:
+        set_category(geom, STATIC)
+
+    for kind in kinds:
+        physbody.set_broadphase(kind)
+        rng = random.Random(0)
+        geoms = [Ball(1.2, 0.5, 1.2, 0.5, BEAVER)]
+        for i in range(count):
+            x = rng.random() * (MAX_X + player_view.width / 2.)
+            y = rng.random() * 10. + 0.5
+            geoms.append(Ball(1., 0.5, x, y, rng.choice([ITEM, CREATURE])))
+
+        counts = [0, 0]
+        def count_pair(args, geom1, geom2):
+            counts[0] += 1
+            counts[1] += len(ode.collide(geom1, geom2))
+
+        start = time.time()
+        for i in range(steps):
+            physbody.collide(None, count_pair)
+        elapsed = time.time() - start
+
+        sys.stdout.write('%-10s %8.1f pairs %8.1f contacts %8.3f ms\n' % (
+            kind, float(counts[0]) / steps, float(counts[1]) / steps,
+            elapsed * 1000. / steps))
+        for geom in geoms:
+            physbody.remove(geom)
+
+    for geom in static:
+        physbody.remove(geom)
+    physbody.set_broadphase(SIMPLE)
@@ -1,9 +1,6 @@
-import random
-
 import pygame
 
 from dambuilder import living, anim
-from dambuilder.beaver import Beaver
 from dambuilder.view import coord, conv, visible
 from dambuilder.living import ILLEGAL, WALKING, WADING, SWIMMING, FLYING
 
@@ -11,18 +8,29 @@ BIRD_FLEE_WATER = 10
 
 class Bird(living.Living):
 
-    def __init__(self, geom):
-        super(Bird, self).__init__(geom, 1, 10)
-        self.geom.getBody().setGravityMode(False)
+    density = 0.2
+    radius = 0.5
 
+    def __init__(self, geom, clock):
         self.fly_timeout = living.Timeout(500)
+        super(Bird, self).__init__(geom, 1, 10, clock)
+
+    def reset(self, geom, clock):
+        super(Bird, self).reset(geom, clock)
+        self.geom.getBody().setGravityMode(False)
+        self.fly_timeout.clock = clock
+        self.fly_timeout.stop()
         self.change_animation(anim.BirdFlying)
+
+    def get_timeouts(self):
+        return [self.fly_timeout]
         
     def behavior(self, stepsize, world):
         x, y, dummy = self.geom.getPosition()
         #w, h = self.anim.get_size()
 
         body = self.geom.getBody()
+        rng = world.rng.birds
 
         dam = self.near_dam(world)
         state = self.get_state(world)
@@ -31,10 +39,9 @@ class Bird(living.Living):
             # fly up out of the water
             body.addForce((0, 50., 0))
             
-        if self._collisions:
-            for obj in self._collisions:
-                if isinstance(obj, Beaver):
-                    self.escape(obj, dam, 25)
+        if self._fleeing_from is not None:
+            self.escape(self._fleeing_from, dam, 25)
+            self._fleeing_from = None
         
         if dam is not None:
             if x < dam.start_x:
@@ -66,7 +73,7 @@ class Bird(living.Living):
             r = 3
         else:
             # random flight
-            r = random.randint(0, 3)
+            r = rng.randint(0, 3)
     
         if r == 0:
             if not self.fly_timeout.active():
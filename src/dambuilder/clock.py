@@ -0,0 +1,29 @@
+import pygame
+
+class WallClock(object):
+    """Time as it passes for the player, in milliseconds.
+    """
+
+    def get_ticks(self):
+        return pygame.time.get_ticks()
+
+wall_clock = WallClock()
+
+class SimulationClock(object):
+    """Time in the simulated world, in milliseconds.
+
+    It only moves on when the world steps, so anything timed by it
+    behaves the same no matter how fast the world is stepped.
+    """
+
+    def __init__(self):
+        self._ticks = 0.
+
+    def advance(self, stepsize):
+        self._ticks += stepsize * 1000.
+
+    def get_ticks(self):
+        return self._ticks
+
+    def set_ticks(self, ticks):
+        self._ticks = ticks
@@ -39,9 +39,25 @@ NEGLIBLE_WATER_LEVEL_FACTOR = 8.
 # slack in meters for when an object 'near' a dam
 NEAR_DAM_SLACK = 0.05
 
+# the game is over when the water level on land gets above this
+GAME_OVER_LEVEL = 10.
+
 # gravity of simulation
 GRAVITY = -9.81
 
+# items and critters further than this beyond the corners of the view
+# are dormant: they're not simulated until they come closer
+ACTIVITY_MARGIN = 8.
+# items and critters only go dormant once they've settled down, moving
+# slower than this
+DORMANT_SPEED = 0.1
+
+# ODE disables bodies that move slower than this for a number of steps,
+# until something bumps into them
+AUTO_DISABLE_LINEAR_THRESHOLD = 0.01
+AUTO_DISABLE_ANGULAR_THRESHOLD = 0.01
+AUTO_DISABLE_STEPS = 10
+
 # force in which waterfall droplets are ejected
 WATERFALL_DROPLET_FORCE = 0.01
 
@@ -1,21 +1,32 @@
-import random
+from array import array
+from bisect import bisect
 
 import pygame
 from pygame.locals import *
 
 from dambuilder import waterfall
-from dambuilder.leak import Leak
+from dambuilder.waterfall import DROPLETS_PER_RATE
+from dambuilder.leak import Leak, RATE_IMAGE_THRESHOLDS
 from dambuilder.view import coord, conv, player_view
-from dambuilder.material import (SECTION_HEIGHT, render_material)
-from dambuilder.physbody import Immovable, ode_world, ode_space
+from dambuilder.material import (SECTION_HEIGHT, MATERIAL_CODES,
+                                 MaterialColumn)
+from dambuilder import physbody
+from dambuilder.physbody import resize_immovable
 from dambuilder.constants import (WATER_COLOR, FLOOD_RATE,
                                   MAX_X, INITIAL_LEAK_RATE,
-                                  WOOD,
+                                  WOOD, MATERIALS,
                                   MATERIAL_ANIMAL_EROSION,
+                                  MATERIAL_EROSION_DRY,
+                                  MATERIAL_EROSION_WET,
                                   NEW_LEAK_CHANCE)
 
 leak_connection_id = 0
 
+def get_section(y):
+    """The index of the section of a dam at height y.
+    """
+    return int(y / SECTION_HEIGHT)
+
 class DamSentinel(object):
     """A dam that isn't really there, but is a sentinel for the dam
     doubly-linked list.
@@ -27,6 +38,12 @@ class DamSentinel(object):
         self.next_dam = None
 
 class Dam(object):
+
+    # erode leaks as much as the game originally did by eroding a random
+    # sample of at most 10 leaks each step. If False, every leak erodes
+    # at its full rate.
+    sample_erosion = True
+
     def __init__(self, id, geom, level, prev_dam, next_dam):
         self.id = id
         
@@ -42,31 +59,72 @@ class Dam(object):
         self.level = level
         self.prev_dam = prev_dam
         self.next_dam = next_dam
-        self._leaks = []
+        # leaks by section, then by connection id
+        self._leaks = {}
+        # all leaks, to pick leaks to erode from, and the slot of each
+        # connection id in there
+        self._leak_list = []
+        self._leak_slots = {}
+        # leaks that are new or had their rate changed since last update
+        self._changed_leaks = {}
+        # leaks with a waterfall that needs updating
+        self._flowing_leaks = {}
+        # waterline and flow direction at last update of the leaks
+        self._waterline = None
+        self._flow_reversed = None
 
         # this requires us to only make dams that are multiple of
         # SECTION_HEIGHT high
 
-        self._materials = [WOOD] * int(height / SECTION_HEIGHT)
+        # material code for each section
+        self._materials = array('B', [MATERIAL_CODES[WOOD]]) * int(
+            height / SECTION_HEIGHT)
+        self._column = MaterialColumn()
 
+        # droplets of the flooding waterfall and of all leaks
+        self._particles = waterfall.Particles()
         self._waterfall = waterfall.Waterfall(
-            0., 0., 0.1,
+            self._particles, 0., 0., 0.1,
             self.start_x, self.end_x, height)
 
     def clear_ode(self):
-        ode_space.remove(self.geom)
-        self._waterfall.clear_ode()
-        for leak in self._leaks:
-            leak.clear_ode()
+        physbody.remove(self.geom)
         
     # MANIPULATORS
 
     def add_leak(self, world, height, rate):
         global leak_connection_id
-        xs, xe = self.geom.getAABB()[:2]
-        leak = Leak(xs, xe, height, rate, leak_connection_id)
-        self._leaks.append(leak)
+        self.insert_leak(leak_connection_id, height, rate)
         leak_connection_id += 1
+
+    def insert_leak(self, connection_id, height, rate):
+        xs, xe = self.geom.getAABB()[:2]
+        leak = Leak(self._particles, xs, xe, height, rate, connection_id)
+        section = get_section(height)
+        self._leaks.setdefault(section, {})[connection_id] = leak
+        self._leak_slots[connection_id] = len(self._leak_list)
+        self._leak_list.append(leak)
+        self._changed_leaks[connection_id] = leak
+
+    def remove_leak(self, leak):
+        section = get_section(leak.height)
+        leaks = self._leaks[section]
+        del leaks[leak.connection_id]
+        if not leaks:
+            del self._leaks[section]
+        # move the last leak into the slot so removal is cheap
+        slot = self._leak_slots.pop(leak.connection_id)
+        last = self._leak_list.pop()
+        if last is not leak:
+            self._leak_list[slot] = last
+            self._leak_slots[last.connection_id] = slot
+        self._changed_leaks.pop(leak.connection_id, None)
+        self._flowing_leaks.pop(leak.connection_id, None)
+
+    def leak_changed(self, leak):
+        """Let the dam know the rate of leak changed.
+        """
+        self._changed_leaks[leak.connection_id] = leak
             
     def fix_leaks_at(self, world, y, check_size, amount, material):
         """Returns True when material could actually be used and leak is
@@ -75,13 +133,15 @@ class Dam(object):
         water_world = world._water_world
         for leak in self.get_leaks_at(y, check_size):
             leak.rate -= amount
+            self.leak_changed(leak)
             if leak.rate < 0.:
-                leak.clear_ode()
-                self._leaks.remove(leak)
+                self.remove_leak(leak)
                 if water_world.have_connection(leak.connection_id):
                     water_world.disconnect(leak.connection_id)
                 # replace material at spot with active material
-                self._materials[int(leak.height / SECTION_HEIGHT)] = material
+                section = get_section(leak.height)
+                self._materials[section] = MATERIAL_CODES[material]
+                self._column.invalidate(section)
                 return True
         return False
 
@@ -96,11 +156,31 @@ class Dam(object):
             material = self.get_material(y)
             for leak in leaks:
                 leak.rate += amount * MATERIAL_ANIMAL_EROSION[material]
+                self.leak_changed(leak)
         else:
             self.add_leak(world, y, INITIAL_LEAK_RATE)
 
     def build_up(self, material):
-        self._materials.append(material)
+        self._materials.append(MATERIAL_CODES[material])
+        self._column.invalidate(len(self._materials) - 1)
+        self.update_height()
+
+    def restore(self, codes, leaks):
+        """Give a new dam the material codes of its sections and leaks.
+
+        leaks is a list of (connection_id, height, rate). Their
+        connections in the water world are left alone.
+        """
+        self._materials = array('B', codes)
+        self._column = MaterialColumn()
+        self.update_height()
+        for connection_id, height, rate in leaks:
+            self.insert_leak(connection_id, height, rate)
+        # look at all leaks on the next update, so the flowing ones
+        # get their waterfalls back
+        self._waterline = None
+
+    def update_height(self):
         h = len(self._materials) * SECTION_HEIGHT
         self.height = h
         # adjust waterfall too, ugly
@@ -109,29 +189,61 @@ class Dam(object):
         # adjust geom
         x, y, dummy = self.geom.getPosition()
         w, dummy, dummy = self.geom.getLengths()
-        if ode_space is not None:
-            ode_space.remove(self.geom)
-            geom = Immovable(x, h / 2., w, h)
-        else:
-            # XXX argh
-            from dambuilder.tests import MockGeomBox
-            geom = MockGeomBox(x, h/2., w, h)
-        self.geom = geom
+        resize_immovable(self.geom, x, h / 2., w, h)
 
     def step_erosion(self, stepsize, world):
         """Erode leaks that already have been created.
-        """
-        dam_height = self.height
 
-        # the more leaks, the more will be eroding at the same time
-        erode_attempts = int(len(self._leaks) / 10.) + 1
-        if erode_attempts > 10:
-            erode_attempts = 10
+        By default a few leaks picked at random erode each step, the
+        more leaks the more of them. Without sample_erosion all leaks
+        erode in a single pass, a section at a time, so the material of
+        each section is only looked up once.
+        """
+        leak_list = self._leak_list
+        if not leak_list:
+            return
 
-        if self._leaks:
+        water_height = self.get_highest_level().level
+        if self.sample_erosion:
+            # the more leaks, the more will be eroding at the same time
+            erode_attempts = int(len(leak_list) / 10.) + 1
+            if erode_attempts > 10:
+                erode_attempts = 10
+            rng = world.rng.erosion
             for i in range(erode_attempts):
-                leak = random.choice(self._leaks)
-                leak.step_erosion(stepsize, self)
+                leak = rng.choice(leak_list)
+                material = MATERIALS[
+                    self._materials[get_section(leak.height)]]
+                if leak.height > water_height:
+                    leak.rate += MATERIAL_EROSION_DRY[material] * stepsize
+                else:
+                    self.erode_wet(leak,
+                                   MATERIAL_EROSION_WET[material] * stepsize)
+            return
+
+        for section, leaks in self._leaks.items():
+            material = MATERIALS[self._materials[section]]
+            dry = MATERIAL_EROSION_DRY[material] * stepsize
+            wet = MATERIAL_EROSION_WET[material] * stepsize
+            for leak in leaks.values():
+                if leak.height > water_height:
+                    leak.rate += dry
+                else:
+                    self.erode_wet(leak, wet)
+
+    def erode_wet(self, leak, amount):
+        """Erode a leak under water by amount.
+
+        Only leaks under water show their rate, and they only need an
+        update when their waterfall or their image changes with it.
+        """
+        rate = leak.rate
+        leak.rate = rate + amount
+        if (int(leak.rate * DROPLETS_PER_RATE) !=
+            int(rate * DROPLETS_PER_RATE) or
+            bisect(RATE_IMAGE_THRESHOLDS, leak.rate) !=
+            bisect(RATE_IMAGE_THRESHOLDS, rate)):
+            self._changed_leaks[leak.connection_id] = leak
 
     def update_flooded(self, world):
         water_world = world._water_world
@@ -153,25 +265,53 @@ class Dam(object):
                 self._waterfall.cut_flow()
 
     def update_leaks(self, world):
-        """Create connections for all active leaks, and close those
-        for those leaks above water.
+        """Create connections for leaks that got below the waterline,
+        and close those for leaks that got above it.
+
+        Only leaks between the previous and the current waterline, and
+        leaks that are new or changed their rate, need to be looked
+        at. When the flow turns around all leaks are updated.
         """
         water_world = world._water_world
         prev_level = self.get_prev_level()
-        highest_level = self.get_highest_level()
-        
-        for leak in self._leaks:
-            if leak.between(0, highest_level.level):
+        waterline = self.get_highest_level().level
+        flow_reversed = prev_level.level > self.level.level
+
+        if (self._waterline is None or
+            flow_reversed != self._flow_reversed):
+            leaks = self.get_leaks()
+        else:
+            leaks = self.get_leaks_between(min(self._waterline, waterline),
+                                           max(self._waterline, waterline))
+            leaks.extend(self._changed_leaks.values())
+        self._waterline = waterline
+        self._flow_reversed = flow_reversed
+        self._changed_leaks = {}
+
+        for leak in leaks:
+            if leak.between(0, waterline):
                 leak.activate(water_world, self.level, prev_level)
+                self._flowing_leaks[leak.connection_id] = leak
             else:
                 leak.deactivate(water_world)
-            leak.update()
 
-    def update(self, world):
+    def update_waterfalls(self, stepsize):
+        self._particles.update(stepsize)
+        self._waterfall.add(stepsize)
+        for leak in list(self._flowing_leaks.values()):
+            leak.update(stepsize)
+            if not leak.is_flowing():
+                del self._flowing_leaks[leak.connection_id]
+
+    def update_flow(self, world):
+        """Update the flow of water through and over the dam.
+        """
         self.update_flooded(world)
         self.update_leaks(world)
-        if ode_world is not None:
-            self._waterfall.update()
+
+    def update(self, world, stepsize):
+        self.update_flow(world)
+        self.update_waterfalls(stepsize)
 
     # ACCESSORS
     
@@ -198,11 +338,24 @@ class Dam(object):
 
     def get_leaks_between(self, start_y, end_y):
         result = []
-        for leak in self._leaks:
-            if leak.between(start_y, end_y):
-                result.append(leak)
+        for section in range(get_section(start_y), get_section(end_y) + 1):
+            leaks = self._leaks.get(section)
+            if leaks is None:
+                continue
+            for leak in leaks.values():
+                if leak.between(start_y, end_y):
+                    result.append(leak)
         return result
 
+    def get_material_codes(self):
+        return self._materials
+
+    def get_leak_count(self):
+        return len(self._leak_list)
+
+    def get_leaks(self):
+        return list(self._leak_list)
+
     def get_highest_level(self):
         level = self.level
         prev_level = self.get_prev_level()
@@ -211,11 +364,19 @@ class Dam(object):
         else:
             return prev_level
 
+    def get_waterfalls(self):
+        """Waterfalls of the dam that may have droplets.
+        """
+        result = [self._waterfall]
+        for leak in self._flowing_leaks.values():
+            result.append(leak.get_waterfall())
+        return result
+
     def get_material(self, y):
         if y > self.height:
             return None
         i = y / SECTION_HEIGHT
-        return self._materials[int(i)]
+        return MATERIALS[self._materials[int(i)]]
     
     def render_dam(self, screen, x):
         # start height at which we're drawing sections
@@ -226,14 +387,10 @@ class Dam(object):
         e = int(he / SECTION_HEIGHT)
         if s > 0:
             s -= 1
-        e += 1
-        materials = self._materials[s:e]
-    
-        i = s
-        for material in materials:
-            y = SECTION_HEIGHT + SECTION_HEIGHT * i
-            render_material(screen, x, y, material)
-            i += 1
+        e = min(e + 1, len(self._materials))
+        if s >= e:
+            return
+        self._column.render(screen, x, self._materials, s, e)
                 
     def render(self, screen):
         xs, xe, ys, ye, zs, ze = self.geom.getAABB()
@@ -255,8 +412,8 @@ class Dam(object):
                     Rect(coord(xe, self.level.level),
                          (conv(nxs - xe), conv(self.level.level) + 1)))
         # draw leaks
-        for leak in self._leaks:
+        for leak in self.get_leaks():
             leak.render(screen, self)
 
-        # flooding waterfall
-        self._waterfall.render(screen)
+        # droplets of flooding and leaks
+        self._particles.render(screen)
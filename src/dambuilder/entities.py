@@ -0,0 +1,82 @@
+class Registry(object):
+    """Entities in the world, such as items or livings.
+
+    Every entity gets a handle that stays the same for as long as it's
+    registered. Entities are kept in a list in no particular order, so
+    that removing one only moves the last entity into its place.
+
+    Adding and removing is queued until flush, which makes it safe to
+    do while looping over the entities, for instance from a behavior.
+    """
+
+    def __init__(self):
+        self._entities = []
+        # handle of each entity in _entities
+        self._handles = []
+        # handle -> index in _entities
+        self._indexes = {}
+        self._next_handle = 0
+        self._added = []
+        self._removed = []
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __iter__(self):
+        return iter(self._entities)
+
+    def __getitem__(self, index):
+        return self._entities[index]
+
+    def add(self, entity):
+        """Queue entity to be added, returning its handle.
+        """
+        handle = self._next_handle
+        self._next_handle += 1
+        entity.handle = handle
+        self._added.append((handle, entity))
+        return handle
+
+    def remove(self, entity):
+        """Queue entity to be removed.
+
+        Returns False if it was already queued to be removed, True
+        otherwise.
+        """
+        if entity.handle is None:
+            return False
+        self._removed.append((entity.handle, entity))
+        entity.handle = None
+        return True
+
+    def get(self, handle):
+        """The entity with handle, or None if there's no such entity.
+        """
+        index = self._indexes.get(handle)
+        if index is None:
+            return None
+        return self._entities[index]
+
+    def flush(self):
+        """Carry out queued adds and removes.
+
+        Returns the entities that were removed.
+        """
+        for handle, entity in self._added:
+            self._indexes[handle] = len(self._entities)
+            self._entities.append(entity)
+            self._handles.append(handle)
+        self._added = []
+        removed = []
+        for handle, entity in self._removed:
+            index = self._indexes.pop(handle)
+            last = len(self._entities) - 1
+            if index != last:
+                self._entities[index] = self._entities[last]
+                self._handles[index] = self._handles[last]
+                self._indexes[self._handles[index]] = index
+            del self._entities[last]
+            del self._handles[last]
+            removed.append(entity)
+        self._removed = []
+        return removed
@@ -1,9 +1,6 @@
-import random
-
 import pygame
 
 from dambuilder import living, anim
-from dambuilder.beaver import Beaver
 from dambuilder.view import coord, conv, visible
 from dambuilder.living import ILLEGAL, WALKING, WADING, SWIMMING, FLYING
 
@@ -21,26 +18,36 @@ class Fish(living.Living):
     nibbling_anim = anim.FishBlueNibbling
     x_friction = 1
     y_friction = 10
+    density = 0.4
+    radius = 0.5
     
-    def __init__(self, geom):
-        super(Fish, self).__init__(geom, self.x_friction, self.y_friction)
-        self.geom.getBody().setGravityMode(False)
-
+    def __init__(self, geom, clock):
         self.fly_timeout = living.Timeout(self.timeout)
+        super(Fish, self).__init__(geom, self.x_friction, self.y_friction,
+                                   clock)
+
+    def reset(self, geom, clock):
+        super(Fish, self).reset(geom, clock)
+        self.geom.getBody().setGravityMode(False)
+        self.fly_timeout.clock = clock
+        self.fly_timeout.stop()
         self.change_animation(self.swimming_anim)
+
+    def get_timeouts(self):
+        return [self.fly_timeout]
         
     def behavior(self, stepsize, world):
         x, y, dummy = self.geom.getPosition()
         #w, h = self.anim.get_size()
 
         body = self.geom.getBody()
+        rng = world.rng.fish
 
         dam = self.near_dam(world)
         
-        if self._collisions:
-            for obj in self._collisions:
-                if isinstance(obj, Beaver):
-                    self.escape(obj, dam, self.escape_force)
+        if self._fleeing_from is not None:
+            self.escape(self._fleeing_from, dam, self.escape_force)
+            self._fleeing_from = None
 
         state = self.get_state(world)
 
@@ -52,7 +59,7 @@ class Fish(living.Living):
         # flop around
         if state is WALKING or state is WADING:
             body.addForce(
-                ((random.random() * stepsize * stepsize) - (5 * stepsize),
+                ((rng.random() * stepsize * stepsize) - (5 * stepsize),
                  self.swim_force * stepsize, 0))
 
         if dam is not None:
@@ -83,7 +90,7 @@ class Fish(living.Living):
             r = 3
         else:
             # random swimming
-            r = random.randint(0, 3)
+            r = rng.randint(0, 3)
     
         if r == 0:
             if not self.fly_timeout.active():
@@ -3,11 +3,21 @@ import sys
 import pygame
 from pygame.locals import *
 
+from dambuilder import world as world_module
 from dambuilder.world import World
+from dambuilder import physbody
+from dambuilder.pool import AllocationReport
 from dambuilder.load import load
-from dambuilder.input import player_input
+from dambuilder.input import player_input, Recording
 from dambuilder.constants import SKY_COLOR
 
+# write how many objects get allocated each second
+report_allocations = False
+# steps per frame, to run the game faster than real time
+speed = 1
+# if set, save a recording of the player input of the game here
+record_path = None
+
 def mainloop(screen):
     pygame.mouse.set_visible(False)
 
@@ -17,6 +27,14 @@ def mainloop(screen):
     clk = pygame.time.Clock()
     fps = 50
     dt = 1.0 / fps
+
+    allocation_report = AllocationReport([
+        ('balls', physbody.ball_pool),
+        ('items', world_module.item_pool),
+        ('livings', world_module.living_pool)])
+    ticks = 0
+
+    recording = Recording(world.rng.seed, dt)
  
     while True:
         player_input.handle_events()
@@ -28,15 +46,26 @@ def mainloop(screen):
                     
         pygame.display.flip()
 
-        world.step(dt)
+        for i in range(speed):
+            recording.record(player_input.get_state())
+            world.step(dt)
+            if world.is_game_over():
+                break
 
         if world.is_game_over():
             break
 
         clk.tick(fps)
+
+        ticks += 1
+        if report_allocations and ticks % fps == 0:
+            allocation_report.report(1.0)
         #print "fps: %2.1f  dt:%d rawdt:%d"%(clk.get_fps(), clk.get_time(), clk.get_rawtime())
 
     score = world.get_water_world().get_level('sea').level
+
+    if record_path is not None:
+        recording.save(record_path)
                                               
     # clean out all ODE objects
     world.clear_ode()
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+from array import array
+
+# no window and no sound; this has to happen before pygame starts up
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+from dambuilder.load import sounds
+from dambuilder.input import Replay, load_recording
+from dambuilder.world import World
+from dambuilder import snapshot
+
+# names of the summary arrays step_many returns
+SUMMARY = ['sea', 'land', 'dam_height', 'leaks']
+
+def init():
+    """Start pygame without a display.
+
+    Animations still load and convert their images, so we need a video
+    mode, but it's a tiny one on the dummy driver.
+    """
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    sounds.enabled = False
+
+class Simulation(object):
+    """A world that's stepped as fast as possible, without rendering.
+    """
+
+    def __init__(self, world=None, seed=None, recording=None):
+        """Simulate world, or a new world with seed.
+
+        If there's a recording, the new world gets its seed and the
+        player input is replayed from it.
+        """
+        if recording is not None:
+            seed = recording.seed
+            self.replay = Replay(recording)
+        else:
+            self.replay = None
+        if world is None:
+            world = World(seed=seed)
+            world.setup()
+        # nobody sees the droplets of waterfalls
+        world.droplets = False
+        self.world = world
+        self.ticks = 0
+
+    def checkpoint(self, path):
+        """Save a snapshot of the world, to go on from later.
+        """
+        snapshot.save(self.world, path)
+
+    def step_many(self, n, dt):
+        """Step the world n times by dt, or until the game or the
+        replay is over.
+
+        Returns a dictionary with an array for each name in SUMMARY,
+        with a value after each step.
+        """
+        world = self.world
+        water_world = world.get_water_world()
+        sea = water_world.get_level('sea')
+        land = water_world.get_level('start')
+        dam = world.dam
+        summary = {}
+        for name in SUMMARY:
+            summary[name] = array('d')
+        sea_levels = summary['sea']
+        land_levels = summary['land']
+        dam_heights = summary['dam_height']
+        leak_counts = summary['leaks']
+        replay = self.replay
+        for i in range(n):
+            if replay is not None and not replay.step():
+                break
+            world.step(dt)
+            self.ticks += 1
+            sea_levels.append(sea.level)
+            land_levels.append(land.level)
+            dam_heights.append(dam.height)
+            leak_counts.append(dam.get_leak_count())
+            if world.is_game_over():
+                break
+        return summary
+
+def main():
+    """Soak test a game of a number of seconds, 30 minutes by default.
+
+    An optional second argument is the seed of the world. With -r and
+    the path of a recording, replay that game instead. With -l, the
+    path of a snapshot and optionally a number of seconds, go on from
+    the snapshot.
+    """
+    init()
+    fps = 50
+    dt = 1.0 / fps
+    if len(sys.argv) > 2 and sys.argv[1] == '-r':
+        recording = load_recording(sys.argv[2])
+        simulation = Simulation(recording=recording)
+        steps = len(recording)
+        dt = recording.stepsize
+        fps = 1.0 / dt
+    elif len(sys.argv) > 2 and sys.argv[1] == '-l':
+        simulation = Simulation(world=snapshot.load(sys.argv[2]))
+        if len(sys.argv) > 3:
+            seconds = float(sys.argv[3])
+        else:
+            seconds = 30 * 60.
+        steps = int(seconds * fps)
+    else:
+        if len(sys.argv) > 1:
+            seconds = float(sys.argv[1])
+        else:
+            seconds = 30 * 60.
+        if len(sys.argv) > 2:
+            seed = int(sys.argv[2])
+        else:
+            seed = None
+        simulation = Simulation(seed=seed)
+        steps = int(seconds * fps)
+    start = time.time()
+    summary = simulation.step_many(steps, dt)
+    elapsed = time.time() - start
+    ticks = len(summary['sea'])
+    sys.stdout.write('seed %d\n' % simulation.world.rng.seed)
+    sys.stdout.write('%d steps (%.1f game seconds) in %.2f seconds\n' % (
+        ticks, ticks / float(fps), elapsed))
+    if ticks:
+        sys.stdout.write(
+            'sea %.2f, land %.2f, dam height %.2f, leaks %d\n' % (
+            summary['sea'][-1], summary['land'][-1],
+            summary['dam_height'][-1], summary['leaks'][-1]))
+    if simulation.world.is_game_over():
+        sys.stdout.write('game over\n')
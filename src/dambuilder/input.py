@@ -1,4 +1,5 @@
 import sys
+import struct
 
 import pygame
 from pygame.locals import *
@@ -55,4 +56,138 @@ class Input(object):
                 elif e.key == K_RETURN:
                     self.action3 = False
 
+    def get_state(self):
+        """The input packed into a byte, see the input state bits below.
+        """
+        state = DIRECTION_CODES[self.x_direction]
+        state |= DIRECTION_CODES[self.y_direction] << 2
+        if self.action1:
+            state |= ACTION1
+        if self.action2:
+            state |= ACTION2
+        if self.action3:
+            state |= ACTION3
+        if self.quit_request:
+            state |= QUIT_REQUEST
+        return state
+
+    def set_state(self, state):
+        """Set the input from a byte made by get_state.
+        """
+        self.x_direction = DIRECTIONS[state & 3]
+        self.y_direction = DIRECTIONS[(state >> 2) & 3]
+        self.action1 = bool(state & ACTION1)
+        self.action2 = bool(state & ACTION2)
+        self.action3 = bool(state & ACTION3)
+        self.quit_request = bool(state & QUIT_REQUEST)
+
+# input state bits: x direction in bits 0-1 and y direction in bits 2-3,
+# followed by one bit for each flag
+DIRECTIONS = [None, 1, -1]
+DIRECTION_CODES = {None: 0, 1: 1, -1: 2}
+ACTION1 = 16
+ACTION2 = 32
+ACTION3 = 64
+QUIT_REQUEST = 128
+
 player_input = Input()
+
+# identifies recording files
+RECORDING_MAGIC = 0x44425231
+# magic, seed, stepsize and number of runs
+RECORDING_HEADER = '<IIdI'
+
+class Recording(object):
+    """The player input for every step of a game, and the world's seed.
+
+    The input is kept as runs of steps with the same input state, as it
+    only changes once in a while.
+    """
+
+    def __init__(self, seed, stepsize):
+        self.seed = seed
+        self.stepsize = stepsize
+        # input state of each run and the number of steps in it
+        self.states = []
+        self.lengths = []
+
+    def __len__(self):
+        return sum(self.lengths)
+
+    def record(self, state):
+        """Record the input state of a step.
+        """
+        if self.states and self.states[-1] == state:
+            self.lengths[-1] += 1
+        else:
+            self.states.append(state)
+            self.lengths.append(1)
+
+    def dumps(self):
+        count = len(self.states)
+        return (struct.pack(RECORDING_HEADER, RECORDING_MAGIC, self.seed,
+                            self.stepsize, count) +
+                struct.pack('<%dB' % count, *self.states) +
+                struct.pack('<%dI' % count, *self.lengths))
+
+    def save(self, path):
+        f = open(path, 'wb')
+        f.write(self.dumps())
+        f.close()
+
+class RecordingError(Exception):
+    pass
+
+def loads_recording(data):
+    header_size = struct.calcsize(RECORDING_HEADER)
+    if len(data) < header_size:
+        raise RecordingError("Recording is too short")
+    magic, seed, stepsize, count = struct.unpack(
+        RECORDING_HEADER, data[:header_size])
+    if magic != RECORDING_MAGIC:
+        raise RecordingError("Not a recording")
+    if len(data) != header_size + count * (1 + 4):
+        raise RecordingError("Recording is truncated")
+    recording = Recording(seed, stepsize)
+    offset = header_size
+    recording.states = list(struct.unpack('<%dB' % count,
+                                          data[offset:offset + count]))
+    offset += count
+    recording.lengths = list(struct.unpack('<%dI' % count,
+                                           data[offset:]))
+    return recording
+
+def load_recording(path):
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    return loads_recording(data)
+
+class Replay(object):
+    """Feeds a recording back into an input, one step at a time.
+    """
+
+    def __init__(self, recording, input=player_input):
+        self.recording = recording
+        self.input = input
+        self._run = 0
+        self._left = 0
+
+    def is_done(self):
+        return (self._left == 0 and
+                self._run == len(self.recording.states))
+
+    def step(self):
+        """Set the input for the next step.
+
+        Returns False if the recording is over.
+        """
+        if self._left == 0:
+            if self._run == len(self.recording.states):
+                self.input.clear()
+                return False
+            self.input.set_state(self.recording.states[self._run])
+            self._left = self.recording.lengths[self._run]
+            self._run += 1
+        self._left -= 1
+        return True
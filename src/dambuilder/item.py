@@ -1,27 +1,72 @@
+import math
+from array import array
+
 import pygame
 from pygame.locals import *
 
 from dambuilder.physbody import CollisionBase
 from dambuilder.view import coord, conv
-from dambuilder.physbody import Ball
+from dambuilder.physbody import acquire_ball, release_ball, ITEM
 from dambuilder.load import load
 
-import random
-
 class Item(CollisionBase):
     """Collectible item.
+
+    An item floating in the water is moved around by FloatingItems,
+    without an ODE body. It only gets a real body (see promote) once it
+    leaves the water, so it can fall and roll around.
     """
 
     worth = 1
     radius = 0.5
     density = 1
     
-    def __init__(self, x, y):
-        geom = Ball(self.density, self.radius, x, y)
+    def __init__(self):
+        # released items are reused, see World.remove_item. They have
+        # no geom and float nowhere, so they need no further reset.
+        self.geom = None
+        self.dormant = False
+        # the FloatingItems we float in, and our slot in there
+        self.floating = None
+        self.slot = None
+
+    def get_mass(self):
+        # the same mass ODE gives a sphere of this density
+        return self.density * 4. / 3. * math.pi * self.radius ** 3
+
+    def get_position(self):
+        if self.floating is not None:
+            return self.floating.get_position(self)
+        x, y, dummy = self.geom.getPosition()
+        return x, y
+    
+    def promote(self, x, y, vx, vy):
+        """Give the item a real ODE body at x, y.
+        """
+        geom = acquire_ball(self.density, self.radius, x, y, ITEM)
+        geom.getBody().setLinearVel((vx, vy, 0))
         super(Item, self).__init__(geom)
+
+    def demote(self, floating_items):
+        """Drop our ODE body and let floating_items move us instead.
+        """
+        x, y, dummy = self.geom.getPosition()
+        vx, vy, dummy = self.geom.getBody().getLinearVel()
+        self.remove_geom()
+        floating_items.add(self, x, y, vx, vy)
+
+    def remove_geom(self):
+        release_ball(self.geom)
+        self.geom = None
+        self.dormant = False
         
     def step(self, stepsize, world):
         body = self.geom.getBody()
+        x, y, dummy = self.geom.getPosition()
+        if y < world.get_waterlevel(x).level - self.radius:
+            # fully submerged again, so start floating
+            self.demote(world.get_floating_items())
+            return
         # some friction
         xv, yv, zv = body.getLinearVel()
         body.addForce(((-xv / 2.) * stepsize,
@@ -31,19 +76,19 @@ class Item(CollisionBase):
         # only gravity when not in water
         body.setGravityMode(not in_water)
         if in_water:
-            xf = random.random() * -0.2 * stepsize
-            yf = (random.random() - 0.5) * 10. * stepsize
+            # we may have been disabled by ODE while lying on the ground
+            body.enable()
+            rng = world.rng.drift
+            xf = rng.random() * -0.2 * stepsize
+            yf = (rng.random() - 0.5) * 10. * stepsize
             # drift towards the left
             body.addForce((xf, yf, 0))
 
         # make sure we restrict to z coord
-        x, y, dummy = self.geom.getPosition()
         self.geom.setPosition((x, y, 0))
         
     def in_water(self, world):
-        x, y, z = self.geom.getPosition()
-        size = self.geom.getRadius() * 2
-        height = world.get_height(x)
+        x, y = self.get_position()
         water_height = world.get_waterlevel(x).level
         if y < water_height:
             return True
@@ -51,7 +96,7 @@ class Item(CollisionBase):
             return False
 
     def render(self, screen):
-        x, y, dummy = self.geom.getPosition()
+        x, y = self.get_position()
         image = load(self.image)
         w, h = image.get_size()
         x, y = coord(x, y)
@@ -59,9 +104,123 @@ class Item(CollisionBase):
         y = int(y - h / 2.)
         screen.blit(image, (x, y))
 
-def random_item():
-    if random.random() < 0.99:
-        return random.choice([Bottle, Can, OldBoot, Tyre])
+class FloatingItems(object):
+    """Items floating in the water.
+
+    Floating items don't need ODE: they only drift and bob about. We
+    keep their positions and velocities in arrays and move them with
+    the same forces Item.step applies in water. An item that comes out
+    of the water is promoted to an ODE body.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.xs = array('d')
+        self.ys = array('d')
+        self.vxs = array('d')
+        self.vys = array('d')
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item, x, y, vx, vy):
+        item.floating = self
+        item.slot = len(self.items)
+        self.items.append(item)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.vxs.append(vx)
+        self.vys.append(vy)
+
+    def remove(self, item):
+        # move the last item into the slot so removal is cheap
+        i = item.slot
+        last = len(self.items) - 1
+        if i != last:
+            moved = self.items[last]
+            self.items[i] = moved
+            moved.slot = i
+            self.xs[i] = self.xs[last]
+            self.ys[i] = self.ys[last]
+            self.vxs[i] = self.vxs[last]
+            self.vys[i] = self.vys[last]
+        del self.items[last]
+        del self.xs[last]
+        del self.ys[last]
+        del self.vxs[last]
+        del self.vys[last]
+        item.floating = None
+        item.slot = None
+
+    def get_position(self, item):
+        return self.xs[item.slot], self.ys[item.slot]
+
+    def get_velocity(self, item):
+        return self.vxs[item.slot], self.vys[item.slot]
+    
+    def step(self, stepsize, world):
+        """Move all floating items, and promote those that leave the water.
+        """
+        items = self.items
+        xs, ys, vxs, vys = self.xs, self.ys, self.vxs, self.vys
+        leaving = []
+        # two random numbers for each item
+        randoms = world.rng.drift.sample(2 * len(items))
+        for i in range(len(items)):
+            item = items[i]
+            r = item.radius
+            # forces applied by Item.step, in the same units
+            inv_mass = stepsize / item.get_mass()
+            vx = vxs[i]
+            vy = vys[i]
+            fx = (-vx / 2.) * stepsize + randoms[2 * i] * -0.2 * stepsize
+            fy = ((-vy / 2.) * stepsize +
+                  (randoms[2 * i + 1] - 0.5) * 10. * stepsize)
+            vx += fx * inv_mass
+            vy += fy * inv_mass
+            x = xs[i] + vx * stepsize
+            y = ys[i] + vy * stepsize
+            # the floor and the left edge of the world
+            if y < r:
+                y = r
+                vy = 0.
+            if x < r:
+                x = r
+                vx = 0.
+            # don't drift into dams
+            if (world.get_height(x - r) > y - r or
+                world.get_height(x + r) > y - r):
+                x = xs[i]
+                vx = 0.
+            xs[i] = x
+            ys[i] = y
+            vxs[i] = vx
+            vys[i] = vy
+            if y > world.get_waterlevel(x).level:
+                leaving.append(item)
+        for item in leaving:
+            x, y = self.get_position(item)
+            vx, vy = self.get_velocity(item)
+            self.remove(item)
+            item.promote(x, y, vx, vy)
+
+    def touching(self, x, y, radius):
+        """Items overlapping the circle at x, y with radius.
+        """
+        result = []
+        xs, ys = self.xs, self.ys
+        items = self.items
+        for i in range(len(items)):
+            r = radius + items[i].radius
+            dx = xs[i] - x
+            dy = ys[i] - y
+            if dx * dx + dy * dy < r * r:
+                result.append(items[i])
+        return result
+
+def random_item(rng):
+    if rng.random() < 0.99:
+        return rng.choice([Bottle, Can, OldBoot, Tyre])
     else:
         return Bicycle
     
@@ -86,4 +245,3 @@ class Bicycle(Item):
     image = 'bicycle.png'
     radius = 0.75
     worth = 50
-
@@ -1,30 +1,34 @@
+from bisect import bisect
+
 import pygame
 from pygame.locals import *
 
 from dambuilder import waterfall
 from dambuilder.view import coord, conv
 from dambuilder.load import load, load_colorkey
-from dambuilder.physbody import ode_world, ode_space
 from dambuilder.material import SECTION_HEIGHT
-from dambuilder.constants import (WATER_COLOR, SKY_COLOR, 
-                                  MATERIAL_EROSION_DRY,
-                                  MATERIAL_EROSION_WET)
+from dambuilder.constants import WATER_COLOR, SKY_COLOR
+
+# maximum amount of composed leak sprites to keep around
+MAX_LEAK_SPRITES = 64
+
+# the image of a leak by its rate: below the first threshold the first
+# image, and so on
+RATE_IMAGE_THRESHOLDS = [0.04, 0.07, 0.10, 0.13]
+RATE_IMAGES = ['leak_01.png', 'leak_02.png', 'leak_03.png', 'leak_04.png',
+               'leak_05.png']
+
 class Leak(object):
-    def __init__(self, xs, xe, height, rate, connection_id):
+    def __init__(self, particles, xs, xe, height, rate, connection_id):
         self.xs = xs
         self.xe = xe
         self.height = height
         self.connection_id = connection_id
         self.rate = rate
-        self._waterfall = None
-
         self._waterfall = waterfall.Waterfall(
-            0., 0., 0.1,
+            particles, 0., 0., 0.1,
             xs, xe, height)
 
-    def clear_ode(self):
-        self._waterfall.clear_ode()
-        
     def between(self, start_y, end_y):
         return start_y <= self.height < end_y
 
@@ -46,67 +50,85 @@ class Leak(object):
         water_world.disconnect(self.connection_id)
         self._waterfall.cut_flow()
 
-    def step_erosion(self, stepsize, dam):
-        water_height = dam.get_highest_level().level
-        material = dam.get_material(self.height)
-        
-        if self.height > water_height:
-            self.rate += MATERIAL_EROSION_DRY[material] * stepsize
-        else:
-            self.rate += MATERIAL_EROSION_WET[material] * stepsize
-    
-    def update(self):
-        if ode_world is not None:
-            self._waterfall.update()
+    def update(self, stepsize):
+        """Add droplets coming out of the leak.
+        """
+        self._waterfall.add(stepsize)
+
+    def get_waterfall(self):
+        return self._waterfall
+
+    def is_flowing(self):
+        """True if water or droplets still come out of this leak.
+        """
+        return not self._waterfall.is_empty()
 
-    def create_background(self, dam):
+    def get_water_top(self, dam):
+        """The top pixel row of the water behind the leak sprite, or None
+        if there is no water behind it.
+        """
         water_height = dam.get_highest_level().level
         half_section_height = SECTION_HEIGHT / 2.
 
-        background = pygame.Surface((64, 20))
-        background.fill(SKY_COLOR)
-            
-        if water_height > self.height - half_section_height:
-            background_water_height = water_height - (
-                self.height - half_section_height)
-            if background_water_height > SECTION_HEIGHT:
-                background.fill(WATER_COLOR, Rect(0, 0, 64, 20))
-            else:
-                # XXX contains evil hack to fix 1 pixel offness...
-                background.fill(WATER_COLOR, Rect(
-                    0, 19 - conv(background_water_height), 64, 20))
-        return background
-    
+        if water_height <= self.height - half_section_height:
+            return None
+        background_water_height = water_height - (
+            self.height - half_section_height)
+        if background_water_height > SECTION_HEIGHT:
+            return 0
+        # XXX contains evil hack to fix 1 pixel offness...
+        return 19 - conv(background_water_height)
+
     def render(self, screen, dam):
+        sprite = leak_sprites.get(get_rate_image(self.rate),
+                                  self.get_water_top(dam))
+        screen.blit(sprite,
+                    coord(self.xs, self.height + SECTION_HEIGHT / 2.))
+
+def get_rate_image(rate):
+    """Name of the leak image to show for rate.
+    """
+    return RATE_IMAGES[bisect(RATE_IMAGE_THRESHOLDS, rate)]
+
+class LeakSprites(object):
+    """Leak images composed onto their background, by leak image and
+    height of the water behind them.
+
+    Only the most recently used sprites are kept.
+    """
+
+    def __init__(self, size=MAX_LEAK_SPRITES):
+        self.size = size
+        # (image name, water top) -> [last use, sprite]
+        self._sprites = {}
+        self._uses = 0
+
+    def get(self, image_name, water_top):
+        self._uses += 1
+        key = (image_name, water_top)
+        entry = self._sprites.get(key)
+        if entry is not None:
+            entry[0] = self._uses
+            return entry[1]
+        if len(self._sprites) >= self.size:
+            # evict the least recently used sprite
+            oldest = min([(last_use, cached) for cached, (last_use, sprite)
+                          in self._sprites.items()])[1]
+            del self._sprites[oldest]
+        sprite = self.create(image_name, water_top)
+        self._sprites[key] = [self._uses, sprite]
+        return sprite
+
+    def create(self, image_name, water_top):
         white = (255, 255, 255)
         black = (0, 0, 0)
-        
-        background = self.create_background(dam)
-        
-        if self.rate < 0.04:
-            image = load_colorkey(
-                white,
-                'leaks', 'leak_01.png')
-        elif self.rate < 0.07:
-            image = load_colorkey(
-                white,
-                'leaks', 'leak_02.png')
-        elif self.rate < 0.10:
-            image = load_colorkey(
-                white,
-                'leaks', 'leak_03.png')
-        elif self.rate < 0.13:
-            image = load_colorkey(
-                white,
-                'leaks', 'leak_04.png')
-        else:
-            image = load_colorkey(
-                white,
-                'leaks', 'leak_05.png')
-        background.blit(image, (0, 0))
-        background.set_colorkey(black)
-        
-        screen.blit(background,
-                    coord(self.xs, self.height + SECTION_HEIGHT / 2.))
-        
-        self._waterfall.render(screen)
+
+        sprite = pygame.Surface((64, 20))
+        sprite.fill(SKY_COLOR)
+        if water_top is not None:
+            sprite.fill(WATER_COLOR, Rect(0, water_top, 64, 20))
+        sprite.blit(load_colorkey(white, 'leaks', image_name), (0, 0))
+        sprite.set_colorkey(black)
+        return sprite
+
+leak_sprites = LeakSprites()
@@ -1,9 +1,9 @@
-import pygame
 from pygame.locals import *
 
 from dambuilder.input import player_input
 from dambuilder.view import coord, conv
 from dambuilder import anim
+from dambuilder.clock import wall_clock
 from dambuilder.physbody import CollisionBase
 from dambuilder.constants import NEGLIBLE_WATER_LEVEL_FACTOR, NEAR_DAM_SLACK
 
@@ -14,20 +14,42 @@ SWIMMING = 'swimming'
 FLYING = 'flying'
 
 class Living(CollisionBase):
-    def __init__(self, geom, x_friction_factor=1., y_friction_factor=10.):
+    def __init__(self, geom, x_friction_factor=1., y_friction_factor=10.,
+                 clock=wall_clock):
+        self.x_friction_factor = x_friction_factor
+        self.y_friction_factor = y_friction_factor
+        self.reset(geom, clock)
+
+    def reset(self, geom, clock):
+        """Start afresh with geom, timed by clock.
+
+        Released livings are reused this way, see World.remove_living
+        and World.clear_ode.
+        """
         super(Living, self).__init__(geom)
+        self.clock = clock
+        # animation, started on our clock by change_animation
+        self.anim = None
         # initial facing directions
         self._rightleft = 1
         self._updown = 1        
-        # animation
-        self.anim = None
-        
-        self.x_friction_factor = x_friction_factor
-        self.y_friction_factor = y_friction_factor
+        # what touched us and we want to get away from
+        self._fleeing_from = None
         
     def step(self, stepsize, world):
-        self.friction(stepsize)
-        self.behavior(stepsize, world)
+        body = self.geom.getBody()
+        if body.isEnabled():
+            self.friction(stepsize)
+            self.behavior(stepsize, world)
+        else:
+            # we were disabled by ODE while sitting still, and only get
+            # going again when we push ourselves or start to fall
+            force = body.getForce()
+            gravity = body.getGravityMode()
+            self.behavior(stepsize, world)
+            if (body.getForce() != force or
+                body.getGravityMode() != gravity):
+                body.enable()
         # make sure to constrain body to z dimension
         x, y, dummy = self.geom.getPosition()
         self.geom.setPosition((x, y, 0))
@@ -46,7 +68,7 @@ class Living(CollisionBase):
             self.anim.updown == self._updown):
             return
         self.anim = animation_class(self._rightleft, self._updown)
-        self.anim.start()
+        self.anim.start(self.clock)
 
     def escape(self, obj, dam, escape_force):
         """Try to escape from obj.
@@ -81,6 +103,16 @@ class Living(CollisionBase):
             
         self.geom.getBody().addForce((xf, yf, 0))
     
+    def get_timeouts(self):
+        """All timeouts of this living, in a fixed order.
+        """
+        return []
+
+    def flee_from(self, obj):
+        """Collision handler for objects we want to get away from.
+        """
+        self._fleeing_from = obj
+
     def behavior(self, stepsize, world):
         pass
     
@@ -157,12 +189,24 @@ class Living(CollisionBase):
         self.anim.show(screen, (x, y))
 
 class Timeout(object):
-    def __init__(self, amount):
+    def __init__(self, amount, clock=wall_clock):
+        """Timeout of amount milliseconds, as told by clock.
+        """
         self.amount = amount
+        self.clock = clock
         self._end = 0
         
     def start(self):
-        self._end = pygame.time.get_ticks() + self.amount
+        self._end = self.clock.get_ticks() + self.amount
+
+    def stop(self):
+        self._end = 0
+
+    def getstate(self):
+        return self._end
+
+    def setstate(self, end):
+        self._end = end
 
     def active(self):
-        return pygame.time.get_ticks() < self._end 
+        return self.clock.get_ticks() < self._end 
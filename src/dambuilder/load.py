@@ -49,11 +49,23 @@ images = Images()
 load = images.load
 load_colorkey = images.load_colorkey
 
+class SilentSound(object):
+    """Stands in for sounds when sound is disabled.
+    """
+    def play(self, *args):
+        pass
+
+silent_sound = SilentSound()
+
 class Sounds(object):
     def __init__(self):
         self._sounds = {}
+        # no sound when running headless
+        self.enabled = True
 
     def load(self, *resource_names):
+        if not self.enabled:
+            return silent_sound
         sound = self._sounds.get(resource_names)
         if sound is not None:
             return sound
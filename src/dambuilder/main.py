@@ -1,4 +1,4 @@
-import sys
+from optparse import OptionParser
 
 import pygame
 from pygame.locals import *
@@ -7,14 +7,46 @@ from dambuilder.load import load
 from dambuilder.menu import menuloop
 
 def main():
+    parser = OptionParser()
+    parser.add_option('-b', action='store_true', dest='benchmark',
+                      help='benchmark the broadphase, no display needed')
+    parser.add_option('-a', action='store_true', dest='allocations',
+                      help='report pool allocations per second')
+    parser.add_option('-f', type='int', dest='speed', metavar='STEPS',
+                      help='fast forward, running STEPS steps each frame')
+    parser.add_option('-r', dest='record_path', metavar='FILE',
+                      help='record the player input to replay it headless')
+    parser.add_option('-s', type='choice', dest='broadphase',
+                      choices=['simple', 'hash', 'quadtree'],
+                      metavar='KIND',
+                      help='kind of broadphase space: simple, hash or '
+                      'quadtree')
+    parser.add_option('-p', action='store_true', dest='profile',
+                      help='profile the game')
+    options, args = parser.parse_args()
+
+    if options.benchmark:
+        from dambuilder.bench import benchmark_broadphase
+        benchmark_broadphase()
+        return
+    if options.broadphase is not None:
+        from dambuilder import physbody
+        physbody.set_broadphase(options.broadphase)
+    from dambuilder import game
+    if options.allocations:
+        game.report_allocations = True
+    if options.speed is not None:
+        game.speed = options.speed
+    if options.record_path is not None:
+        game.record_path = options.record_path
+
     pygame.init()
 
     screen = pygame.display.set_mode((800, 600))
     pygame.display.set_caption("Dam Builder")
     pygame.display.set_icon(load('icon.png'))
     
-    if len(sys.argv) > 1 and sys.argv[1] == '-p':
-        # profiling run
+    if options.profile:
         import hotshot, hotshot.stats
         prof = hotshot.Profile('dambuilder.prof')
         benchtime = prof.runcall(menuloop, screen)
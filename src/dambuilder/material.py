@@ -1,17 +1,66 @@
+import pygame
+
 from dambuilder.view import player_view, coord, visible
 from dambuilder.load import load
-from dambuilder.constants import WOOD, STONE, BRICK, METAL
+from dambuilder.constants import WOOD, STONE, BRICK, METAL, MATERIALS
 
 SECTION_HEIGHT = 20. / player_view.pixels_per_meter
 
-def render_material(screen, x, y, material):
+# materials are stored in dams as a byte code, their index in MATERIALS
+MATERIAL_CODES = dict((material, code)
+                      for code, material in enumerate(MATERIALS))
+
+# amount of sections in a cached strip of a column of materials
+STRIP_SECTIONS = 32
+
+def load_material(material):
     if material is WOOD:
-        image = load('materials', 'wood_01.png')
+        return load('materials', 'wood_01.png')
     elif material is STONE:
-        image = load('materials', 'stones.png')
+        return load('materials', 'stones.png')
     elif material is BRICK:
-        image = load('materials', 'bricks.png')
+        return load('materials', 'bricks.png')
     elif material is METAL:
-        image = load('materials', 'metal.png')
-    screen.blit(image, coord(x, y))
-    
+        return load('materials', 'metal.png')
+
+def render_material(screen, x, y, material):
+    screen.blit(load_material(material), coord(x, y))
+
+class MaterialColumn(object):
+    """A column of materials, such as a dam, rendered into strips of
+    STRIP_SECTIONS sections that are kept until a section changes.
+    """
+
+    def __init__(self):
+        self._strips = {}
+
+    def invalidate(self, section):
+        """Section has changed and needs to be rendered again.
+        """
+        self._strips.pop(section // STRIP_SECTIONS, None)
+
+    def render(self, screen, x, codes, s, e):
+        """Render sections s up to e of material codes at x.
+        """
+        for strip in range(s // STRIP_SECTIONS,
+                           (e - 1) // STRIP_SECTIONS + 1):
+            surface = self._strips.get(strip)
+            if surface is None:
+                surface = self.render_strip(codes, strip)
+                self._strips[strip] = surface
+            top = SECTION_HEIGHT * (strip + 1) * STRIP_SECTIONS
+            screen.blit(surface, coord(x, top))
+
+    def render_strip(self, codes, strip):
+        colorkey = (0, 255, 0)
+        w, h = load_material(WOOD).get_size()
+        surface = pygame.Surface((w, h * STRIP_SECTIONS))
+        surface.fill(colorkey)
+        surface.set_colorkey(colorkey)
+        start = strip * STRIP_SECTIONS
+        end = min(start + STRIP_SECTIONS, len(codes))
+        for i in range(start, end):
+            # sections are stacked upwards from the bottom of the strip
+            y = (STRIP_SECTIONS - 1 - (i - start)) * h
+            surface.blit(load_material(MATERIALS[codes[i]]), (0, y))
+        return surface
@@ -1,10 +1,87 @@
 import ode
 
+from dambuilder.view import player_view
+from dambuilder.pool import Pool
+from dambuilder.constants import MAX_X
+
+# kinds of broadphase space
+SIMPLE = 'simple'
+HASH = 'hash'
+QUADTREE = 'quadtree'
+
+# smallest and largest cell size of a hash space, as powers of 2
+HASH_LEVELS = (-2, 4)
+# depth of a quad tree space
+QUADTREE_DEPTH = 5
+
 ode_world = ode.World()
-ode_space = ode.Space()
+# space for everything that moves, see set_broadphase
+ode_space = ode.SimpleSpace()
+# space for static geometry: floor, walls and dams
+static_space = ode.SimpleSpace()
 contactgroup = ode.JointGroup()
+# balls that were released, see acquire_ball
+ball_pool = Pool()
+
+# collision categories
+BEAVER = 1
+CREATURE = 2
+ITEM = 4
+STATIC = 8
+RIGHTMOST = 16
+
+# the categories each category collides with. Other pairs are rejected
+# by ODE itself and never reach the collision callback.
+COLLIDES = {
+    BEAVER: STATIC | RIGHTMOST | CREATURE | ITEM,
+    CREATURE: STATIC | BEAVER,
+    ITEM: STATIC | BEAVER,
+    STATIC: BEAVER | CREATURE | ITEM,
+    RIGHTMOST: BEAVER,
+    }
+
+def create_space(kind, levels=HASH_LEVELS, depth=QUADTREE_DEPTH):
+    if kind == SIMPLE:
+        return ode.SimpleSpace()
+    elif kind == HASH:
+        space = ode.HashSpace()
+        space.setLevels(*levels)
+        return space
+    elif kind == QUADTREE:
+        # ODE divides quad trees along x and z, and as our world is in
+        # the x/y plane this only divides the playing field along x
+        width = MAX_X + player_view.width
+        return ode.QuadTreeSpace((width / 2., width / 2., 0.),
+                                 (width, width, 1.), depth)
+    raise ValueError("Unknown kind of space: %s" % kind)
+
+def set_broadphase(kind, levels=HASH_LEVELS, depth=QUADTREE_DEPTH):
+    """Use a kind of space for everything that moves.
+
+    This needs to be done before anything that moves is created.
+    """
+    global ode_space
+    ode_space = create_space(kind, levels, depth)
+
+def collide(args, callback):
+    """Call callback for all pairs of geoms that may touch.
+
+    Static geometry is only collided with what moves, never with
+    itself.
+    """
+    ode.collide2(static_space, ode_space, args, callback)
+    ode_space.collide(args, callback)
+
+def remove(geom):
+    """Remove geom from the space it's in.
+    """
+    geom.getSpace().remove(geom)
+
+def set_category(geom, category):
+    geom.setCategoryBits(category)
+    geom.setCollideBits(COLLIDES[category])
     
-def Ball(density, radius, x, y):
+def Ball(density, radius, x, y, category):
     body = ode.Body(ode_world)
     m = ode.Mass()
     m.setSphere(density, radius)
@@ -15,25 +92,114 @@ def Ball(density, radius, x, y):
     j.attach(body, None)
     geom = ode.GeomSphere(ode_space, radius=radius)
     geom.setBody(body)
+    set_category(geom, category)
+    return geom
+
+def acquire_ball(density, radius, x, y, category):
+    """Get a ball from the pool, or a new one if there's none.
+    """
+    key = (density, radius, category)
+    geom = ball_pool.acquire(key)
+    if geom is None:
+        geom = Ball(density, radius, x, y, category)
+        geom.pool_key = key
+        return geom
+    body = geom.getBody()
+    body.setPosition((x, y, 0))
+    body.setLinearVel((0, 0, 0))
+    body.setAngularVel((0, 0, 0))
+    body.setForce((0, 0, 0))
+    body.setTorque((0, 0, 0))
+    body.setGravityMode(True)
+    body.enable()
+    ode_space.add(geom)
     return geom
 
-def Immovable(x, y, w, h):
+def release_ball(geom):
+    """Take a ball out of the simulation and put it back in the pool.
+    """
+    geom.obj = None # XXX break cycles
+    remove(geom)
+    geom.getBody().disable()
+    ball_pool.release(geom.pool_key, geom)
+
+def Immovable(x, y, w, h, category=STATIC):
     # immovable object, so no body needed
-    geom = ode.GeomBox(ode_space, (w, h, 0))
+    geom = ode.GeomBox(static_space, (w, h, 0))
     geom.setPosition((x, y, 0))
+    set_category(geom, category)
     return geom
 
+def resize_immovable(geom, x, y, w, h):
+    """Resize and move an immovable object in place.
+
+    The geom stays in its space, so nothing is allocated and the
+    collision code sees the change on the next collide.
+    """
+    geom.setLengths((w, h, 0))
+    geom.setPosition((x, y, 0))
+
 class CollisionBase(object):
     """Base class for all objects that need to detect collisions.
     """
+
+    # whether this object goes dormant when it's far away
+    can_sleep = True
+    # handle in the world's registry, see entities.Registry
+    handle = None
+
     def __init__(self, geom):
         self.geom = geom
         geom.obj = self
-        self._collisions = []
-
-    def clear_collisions(self):
-        self._collisions = []
-        
-    def add_collision(self, obj):
-        self._collisions.append(obj)
-        
+        self.dormant = False
+
+    def sleep(self):
+        """Stop simulating this object until it's woken up.
+        """
+        self.dormant = True
+        self.geom.getBody().disable()
+
+    def wake(self):
+        self.dormant = False
+        self.geom.getBody().enable()
+
+class CollisionDispatcher(object):
+    """Calls handlers for collisions between objects of certain types.
+
+    A handler registered for (A, B) is called with the A and the B
+    object, whichever way around they collided, and also handles
+    subclasses of A and B.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        # (type, type) -> (handler, swapped), as found for those types
+        self._resolved = {}
+
+    def register(self, type1, type2, handler):
+        self._handlers[(type1, type2)] = handler
+        self._resolved = {}
+
+    def dispatch(self, obj1, obj2):
+        key = (type(obj1), type(obj2))
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            resolved = self._resolved[key] = self.resolve(*key)
+        handler, swapped = resolved
+        if handler is None:
+            return
+        if swapped:
+            handler(obj2, obj1)
+        else:
+            handler(obj1, obj2)
+
+    def resolve(self, type1, type2):
+        for base1 in type1.__mro__:
+            for base2 in type2.__mro__:
+                handler = self._handlers.get((base1, base2))
+                if handler is not None:
+                    return handler, False
+                handler = self._handlers.get((base2, base1))
+                if handler is not None:
+                    return handler, True
+        return None, False
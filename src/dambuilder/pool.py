@@ -0,0 +1,55 @@
+import sys
+
+class Pool(object):
+    """Objects that are no longer used, kept around to be used again.
+
+    Objects are kept by key, and objects with the same key must be
+    interchangeable once they've been reset. The pool counts how many
+    objects had to be allocated because none could be reused.
+    """
+
+    def __init__(self):
+        self._free = {}
+        self.allocations = 0
+        self.reuses = 0
+
+    def acquire(self, key):
+        """Get a released object for key.
+
+        Returns None if there is none, in which case the caller should
+        allocate a new object.
+        """
+        free = self._free.get(key)
+        if free:
+            self.reuses += 1
+            return free.pop()
+        self.allocations += 1
+        return None
+
+    def release(self, key, obj):
+        self._free.setdefault(key, []).append(obj)
+
+    def count_free(self):
+        result = 0
+        for free in self._free.values():
+            result += len(free)
+        return result
+
+class AllocationReport(object):
+    """Reports how many objects pools allocated per second.
+    """
+
+    def __init__(self, pools):
+        # list of (name, pool)
+        self._pools = pools
+        self._last = {}
+
+    def report(self, seconds, out=sys.stdout):
+        """Write allocations per second since the last report.
+        """
+        parts = []
+        for name, pool in self._pools:
+            count = pool.allocations - self._last.get(name, 0)
+            self._last[name] = pool.allocations
+            parts.append('%s %.1f' % (name, count / seconds))
+        out.write('allocations/s: %s\n' % ', '.join(parts))
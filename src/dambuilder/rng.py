@@ -0,0 +1,80 @@
+import random
+
+# how many numbers a stream draws from its generator at a time
+BATCH_SIZE = 256
+
+# the streams of random numbers of a world, in the order their seeds
+# are drawn from the world's seed
+STREAMS = ['items', 'drift', 'difficulty', 'fish', 'birds', 'erosion']
+
+class RandomStream(object):
+    """Random numbers for one part of the world.
+
+    Numbers are generated in batches, so drawing a lot of them each
+    step, as for drifting items, costs little more than a list lookup.
+    """
+
+    def __init__(self, seed, batch_size=BATCH_SIZE):
+        self._random = random.Random(seed)
+        self._batch_size = batch_size
+        self._batch = []
+        self._index = 0
+
+    def refill(self, size):
+        # keep what's left of the current batch
+        rnd = self._random.random
+        batch = self._batch[self._index:]
+        batch.extend([rnd() for i in range(size)])
+        self._batch = batch
+        self._index = 0
+
+    def random(self):
+        """A random float in [0, 1).
+        """
+        if self._index == len(self._batch):
+            self.refill(self._batch_size)
+        result = self._batch[self._index]
+        self._index += 1
+        return result
+
+    def sample(self, n):
+        """A list of n random floats in [0, 1).
+        """
+        if self._index + n > len(self._batch):
+            self.refill(max(n, self._batch_size))
+        start = self._index
+        self._index = start + n
+        return self._batch[start:self._index]
+
+    def randint(self, a, b):
+        """A random integer in [a, b].
+        """
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def getstate(self):
+        return self._random.getstate(), self._batch[self._index:]
+
+    def setstate(self, state):
+        random_state, batch = state
+        self._random.setstate(random_state)
+        self._batch = list(batch)
+        self._index = 0
+
+class RandomStreams(object):
+    """A RandomStream for every name in STREAMS, all from one seed.
+
+    A world with the same seed (and the same player input) plays out
+    the same way every time.
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+        seeds = random.Random(seed)
+        for name in STREAMS:
+            setattr(self, name, RandomStream(seeds.randrange(2 ** 32)))
+
+    def get_stream(self, name):
+        return getattr(self, name)
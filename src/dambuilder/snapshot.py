@@ -0,0 +1,388 @@
+import struct
+
+from dambuilder import dam as dam_module
+from dambuilder import waterlevel
+from dambuilder.world import World, item_pool
+from dambuilder.rng import STREAMS
+from dambuilder.item import Bottle, Can, OldBoot, Tyre, Bicycle
+from dambuilder.beaver import Beaver
+from dambuilder.fish import Fish, DangerFish
+from dambuilder.bird import Bird
+from dambuilder.physbody import acquire_ball, CREATURE
+from dambuilder.view import player_view
+from dambuilder.constants import MATERIALS
+from dambuilder.material import MATERIAL_CODES
+
+# identifies snapshots
+MAGIC = 0x44425331
+VERSION = 1
+
+# magic, version, seed, integrator, clock ticks, last difficulty, the
+# next leak connection id and the origin of the player view
+HEADER = 'IHIBdiIdd'
+
+INTEGRATORS = [waterlevel.EXPLICIT, waterlevel.IMPLICIT]
+
+# kinds of connection ids
+STRING_ID = 0
+INT_ID = 1
+
+# classes are stored as their index in these
+ITEM_CLASSES = [Bottle, Can, OldBoot, Tyre, Bicycle]
+LIVING_CLASSES = [Beaver, Fish, DangerFish, Bird]
+
+# class and slot in the floating items, or -1 if it has a body
+ITEM_FORMAT = 'Bi'
+# class, facing left/right and up/down
+LIVING_FORMAT = 'Bbb'
+# position, velocity, angular velocity around z (the only axis the 2D
+# joint lets a ball turn around) and the force to apply on the next
+# step, gravity mode, whether it's dormant and whether it's enabled
+BODY_FORMAT = 'dddddddBBB'
+# worth and selected material
+BEAVER_FORMAT = 'iB'
+
+EMPTY = struct.pack('<')
+
+class SnapshotError(Exception):
+    pass
+
+class Writer(object):
+    def __init__(self):
+        self._parts = []
+
+    def pack(self, format, *values):
+        self._parts.append(struct.pack('<' + format, *values))
+
+    def pack_string(self, s):
+        encoded = s.encode('ascii')
+        self.pack('H', len(encoded))
+        self._parts.append(encoded)
+
+    def pack_doubles(self, values):
+        self.pack('I', len(values))
+        self.pack('%dd' % len(values), *values)
+
+    def getvalue(self):
+        return EMPTY.join(self._parts)
+
+class Reader(object):
+    def __init__(self, data):
+        self._data = data
+        self._offset = 0
+
+    def unpack(self, format):
+        format = '<' + format
+        size = struct.calcsize(format)
+        end = self._offset + size
+        if end > len(self._data):
+            raise SnapshotError("Snapshot is truncated")
+        values = struct.unpack(format, self._data[self._offset:end])
+        self._offset = end
+        return values
+
+    def unpack_string(self):
+        length, = self.unpack('H')
+        end = self._offset + length
+        if end > len(self._data):
+            raise SnapshotError("Snapshot is truncated")
+        s = self._data[self._offset:end].decode('ascii')
+        self._offset = end
+        return str(s)
+
+    def unpack_doubles(self):
+        count, = self.unpack('I')
+        return list(self.unpack('%dd' % count))
+
+    def is_done(self):
+        return self._offset == len(self._data)
+
+def dumps(world):
+    """Take a snapshot of world between steps.
+
+    The snapshot is packed with struct in sections: the header, the
+    random streams, the water world, the dams, the items and the
+    livings. Droplets in the air aren't part of it; the waterfalls
+    start over when the game goes on. Neither is how long ODE has seen
+    a body at rest before it disables it, which PyODE doesn't give us.
+    """
+    writer = Writer()
+    water_world = world.get_water_world()
+    writer.pack(HEADER, MAGIC, VERSION, world.rng.seed,
+                INTEGRATORS.index(water_world.integrator),
+                world.clock.get_ticks(), world._last_difficulty,
+                dam_module.leak_connection_id,
+                player_view.origin_x, player_view.origin_y)
+    for name in STREAMS:
+        dump_stream(writer, world.rng.get_stream(name))
+    dump_water_world(writer, water_world)
+    dams = world.get_dams()
+    writer.pack('I', len(dams))
+    for dam in dams:
+        dump_dam(writer, dam)
+    dump_items(writer, world)
+    livings = world.get_livings()
+    writer.pack('I', len(livings))
+    for living in livings:
+        dump_living(writer, living)
+    return writer.getvalue()
+
+def loads(data, water_world_class=waterlevel.World):
+    """Restore a world from a snapshot.
+
+    This sets up a new world with the seed of the snapshot and then
+    puts the state of the snapshot into it. Bodies come from the pool
+    of balls where possible. The player view is moved back to where it
+    was, as the world looks at it before the beaver moves it again.
+    """
+    reader = Reader(data)
+    (magic, version, seed, integrator, ticks, last_difficulty,
+     leak_connection_id, view_x, view_y) = reader.unpack(HEADER)
+    if magic != MAGIC:
+        raise SnapshotError("Not a snapshot")
+    if version != VERSION:
+        raise SnapshotError("Unknown snapshot version: %s" % version)
+    world = World(water_world_class, INTEGRATORS[integrator], seed)
+    world.setup()
+    try:
+        load_world(reader, world)
+    except SnapshotError:
+        # don't leave the bodies of a broken world in the simulation
+        world.flush_entities()
+        world.clear_ode()
+        raise
+    world.clock.set_ticks(ticks)
+    world._last_difficulty = last_difficulty
+    dam_module.leak_connection_id = max(dam_module.leak_connection_id,
+                                        leak_connection_id)
+    player_view.set_origin(view_x, view_y)
+    return world
+
+def load_world(reader, world):
+    for name in STREAMS:
+        load_stream(reader, world.rng.get_stream(name))
+    load_water_world(reader, world.get_water_world())
+    count, = reader.unpack('I')
+    for i in range(count):
+        load_dam(reader, world)
+    load_items(reader, world)
+    count, = reader.unpack('I')
+    for i in range(count):
+        load_living(reader, world, i)
+    if not reader.is_done():
+        raise SnapshotError("Snapshot has trailing data")
+    world.flush_entities()
+
+def save(world, path):
+    f = open(path, 'wb')
+    f.write(dumps(world))
+    f.close()
+
+def load(path, water_world_class=waterlevel.World):
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    return loads(data, water_world_class)
+
+def dump_stream(writer, stream):
+    (version, internal, gauss_next), batch = stream.getstate()
+    writer.pack('II', version, len(internal))
+    writer.pack('%dI' % len(internal), *internal)
+    writer.pack('Bd', gauss_next is not None, gauss_next or 0.)
+    writer.pack_doubles(batch)
+
+def load_stream(reader, stream):
+    version, count = reader.unpack('II')
+    internal = reader.unpack('%dI' % count)
+    has_gauss_next, gauss_next = reader.unpack('Bd')
+    if not has_gauss_next:
+        gauss_next = None
+    batch = reader.unpack_doubles()
+    stream.setstate(((version, internal, gauss_next), batch))
+
+def dump_connection_id(writer, connection_id):
+    if isinstance(connection_id, int):
+        writer.pack('Bi', INT_ID, connection_id)
+    else:
+        writer.pack('B', STRING_ID)
+        writer.pack_string(connection_id)
+
+def load_connection_id(reader):
+    kind, = reader.unpack('B')
+    if kind == INT_ID:
+        connection_id, = reader.unpack('i')
+        return connection_id
+    return reader.unpack_string()
+
+def dump_water_world(writer, water_world):
+    levels = water_world.get_levels()
+    writer.pack('I', len(levels))
+    for level in levels:
+        writer.pack_string(level.id)
+        writer.pack('Bd', level.level is None, level.level or 0.)
+    connections = water_world.get_connections()
+    writer.pack('I', len(connections))
+    for connection in connections:
+        dump_connection_id(writer, connection.id)
+        writer.pack_string(connection.source_id)
+        writer.pack_string(connection.target_id)
+        writer.pack('dd', connection.rate, connection.minimum_level)
+
+def load_water_world(reader, water_world):
+    count, = reader.unpack('I')
+    for i in range(count):
+        id = reader.unpack_string()
+        is_source, height = reader.unpack('Bd')
+        try:
+            level = water_world.get_level(id)
+        except KeyError:
+            if is_source:
+                water_world.add_source(id)
+            else:
+                water_world.add_level(id, height)
+            continue
+        if not is_source:
+            level.level = height
+    # replace the connections the new world was set up with
+    for connection in water_world.get_connections():
+        water_world.disconnect(connection.id)
+    count, = reader.unpack('I')
+    for i in range(count):
+        connection_id = load_connection_id(reader)
+        source = water_world.get_level(reader.unpack_string())
+        target = water_world.get_level(reader.unpack_string())
+        rate, minimum_level = reader.unpack('dd')
+        water_world.connect(connection_id, source, target, rate,
+                            minimum_level)
+
+def dump_dam(writer, dam):
+    writer.pack_string(dam.id)
+    codes = dam.get_material_codes()
+    writer.pack('I', len(codes))
+    writer.pack('%dB' % len(codes), *codes)
+    leaks = dam.get_leaks()
+    writer.pack('I', len(leaks))
+    for leak in leaks:
+        writer.pack('idd', leak.connection_id, leak.height, leak.rate)
+
+def load_dam(reader, world):
+    id = reader.unpack_string()
+    dam = None
+    for candidate in world.get_dams():
+        if candidate.id == id:
+            dam = candidate
+    if dam is None:
+        raise SnapshotError("Unknown dam: %s" % id)
+    count, = reader.unpack('I')
+    codes = reader.unpack('%dB' % count)
+    count, = reader.unpack('I')
+    leaks = [reader.unpack('idd') for i in range(count)]
+    dam.restore(codes, leaks)
+
+def dump_body(writer, obj):
+    body = obj.geom.getBody()
+    x, y, dummy = body.getPosition()
+    vx, vy, dummy = body.getLinearVel()
+    dummy, dummy, wz = body.getAngularVel()
+    fx, fy, dummy = body.getForce()
+    writer.pack(BODY_FORMAT, x, y, vx, vy, wz, fx, fy,
+                body.getGravityMode(), obj.dormant, body.isEnabled())
+
+def load_body(reader, obj):
+    (x, y, vx, vy, wz, fx, fy,
+     gravity, dormant, enabled) = reader.unpack(BODY_FORMAT)
+    body = obj.geom.getBody()
+    body.setPosition((x, y, 0))
+    body.setLinearVel((vx, vy, 0))
+    body.setAngularVel((0, 0, wz))
+    body.setForce((fx, fy, 0))
+    body.setGravityMode(bool(gravity))
+    if dormant:
+        obj.sleep()
+    elif not enabled:
+        # ODE disabled it as it came to rest
+        body.disable()
+
+def dump_items(writer, world):
+    items = world.get_items()
+    writer.pack('I', len(items))
+    for item in items:
+        if item.floating is not None:
+            writer.pack(ITEM_FORMAT, ITEM_CLASSES.index(type(item)),
+                        item.slot)
+            x, y = item.get_position()
+            vx, vy = item.floating.get_velocity(item)
+            writer.pack('dddd', x, y, vx, vy)
+        else:
+            writer.pack(ITEM_FORMAT, ITEM_CLASSES.index(type(item)), -1)
+            dump_body(writer, item)
+
+def load_items(reader, world):
+    count, = reader.unpack('I')
+    floating = []
+    for i in range(count):
+        index, slot = reader.unpack(ITEM_FORMAT)
+        item_class = ITEM_CLASSES[index]
+        item = item_pool.acquire(item_class)
+        if item is None:
+            item = item_class()
+        if slot >= 0:
+            x, y, vx, vy = reader.unpack('dddd')
+            floating.append((slot, item, x, y, vx, vy))
+        else:
+            item.promote(0., 0., 0., 0.)
+        world.add_item(item)
+        if slot < 0:
+            load_body(reader, item)
+    # floating items draw their random numbers in the order of their
+    # slots, so they go back into the same slots
+    floating.sort()
+    floating_items = world.get_floating_items()
+    for slot, item, x, y, vx, vy in floating:
+        floating_items.add(item, x, y, vx, vy)
+
+def dump_living(writer, living):
+    writer.pack(LIVING_FORMAT, LIVING_CLASSES.index(type(living)),
+                living._rightleft, living._updown)
+    dump_body(writer, living)
+    if isinstance(living, Beaver):
+        writer.pack(BEAVER_FORMAT, living._worth,
+                    MATERIAL_CODES[living._selected_material])
+        writer.pack('%dI' % len(MATERIALS),
+                    *[living._materials[material]
+                      for material in MATERIALS])
+    ends = [timeout.getstate() for timeout in living.get_timeouts()]
+    writer.pack_doubles(ends)
+
+def load_living(reader, world, index):
+    class_index, rightleft, updown = reader.unpack(LIVING_FORMAT)
+    living_class = LIVING_CLASSES[class_index]
+    if living_class is Beaver:
+        # the beaver comes first, and the world already has one
+        if index != 0:
+            raise SnapshotError("Only the first living can be a beaver")
+        living = world.get_livings()[0]
+        load_body(reader, living)
+        worth, selected = reader.unpack(BEAVER_FORMAT)
+        living._worth = worth
+        living._selected_material = MATERIALS[selected]
+        counts = reader.unpack('%dI' % len(MATERIALS))
+        for material, amount in zip(MATERIALS, counts):
+            living._materials[material] = amount
+    else:
+        if index == 0:
+            raise SnapshotError("The first living must be a beaver")
+        geom = acquire_ball(living_class.density, living_class.radius,
+                            0., 0., CREATURE)
+        living = world.reuse_living(living_class, geom)
+        world.add_living(living)
+        load_body(reader, living)
+    living._rightleft = rightleft
+    living._updown = updown
+    ends = reader.unpack_doubles()
+    timeouts = living.get_timeouts()
+    if len(ends) != len(timeouts):
+        raise SnapshotError("Wrong number of timeouts for %s" %
+                            living_class.__name__)
+    for timeout, end in zip(timeouts, ends):
+        timeout.setstate(end)
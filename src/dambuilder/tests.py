@@ -7,12 +7,31 @@ def approx(a, b, d=0.001):
     """
     return (a - d) < b < (a + d)
 
+class MockBody(object):
+    def __init__(self):
+        self.vx = 0.
+        self.vy = 0.
+        self.enabled = True
+
+    def getLinearVel(self):
+        return self.vx, self.vy, 0.
+
+    def isEnabled(self):
+        return self.enabled
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
 class MockGeomSphere(object):
     def __init__(self, x, y, z, radius):
         self.x = x
         self.y = y
         self.z = z
         self.radius = radius
+        self.body = MockBody()
 
     def getPosition(self):
         return self.x, self.y, self.z
@@ -20,6 +39,9 @@ class MockGeomSphere(object):
     def getRadius(self):
         return self.radius
 
+    def getBody(self):
+        return self.body
+
 class MockGeomBox(object):
     def __init__(self, x, y, w, h):
         self.x = x
@@ -31,6 +53,11 @@ class MockGeomBox(object):
         w, h, z = t
         self.w = w
         self.h = h
+
+    def setPosition(self, t):
+        x, y, z = t
+        self.x = x
+        self.y = y
         
     def getPosition(self):
         return self.x, self.y, 0
@@ -52,6 +79,13 @@ def setUp(testcase):
     # we don't want the real ode
     physbody.ode_world = None
     physbody.ode_space = None
+
+def setUpPhysics(testcase):
+    import ode
+    from dambuilder import physbody, world
+    # but some tests need it after all
+    physbody.ode_world = world.ode_world = ode.World()
+    physbody.ode_space = physbody.create_space(physbody.SIMPLE)
     
 def test_suite():
     suite = unittest.TestSuite()
@@ -68,9 +102,37 @@ def test_suite():
                              globs=globs,
                              optionflags=optionflags,
                              setUp=setUp),
+        doctest.DocFileSuite('material.txt',
+                             globs=globs,
+                             optionflags=optionflags,
+                             setUp=setUp),
+        doctest.DocFileSuite('leak.txt',
+                             globs=globs,
+                             optionflags=optionflags,
+                             setUp=setUp),
+        doctest.DocFileSuite('waterfall.txt',
+                             globs=globs,
+                             optionflags=optionflags,
+                             setUp=setUp),
         doctest.DocFileSuite('view.txt',
                              globs=globs,
                              optionflags=optionflags,
                              setUp=setUp),
+        doctest.DocFileSuite('input.txt',
+                             globs=globs,
+                             optionflags=optionflags,
+                             setUp=setUp),
+        doctest.DocFileSuite('physbody.txt',
+                             globs=globs,
+                             optionflags=optionflags,
+                             setUp=setUpPhysics),
+        doctest.DocFileSuite('snapshot.txt',
+                             globs=globs,
+                             optionflags=optionflags,
+                             setUp=setUpPhysics),
+        doctest.DocFileSuite('headless.txt',
+                             globs=globs,
+                             optionflags=optionflags,
+                             setUp=setUpPhysics),
         ])
     return suite
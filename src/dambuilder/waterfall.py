@@ -1,86 +1,221 @@
-import ode
+import math
 
 import pygame
 from pygame.locals import *
 
-from dambuilder import physbody
-from dambuilder.physbody import ode_world, ode_space
-from dambuilder.view import coord, conv
-from dambuilder.constants import WATERFALL_COLOR, WATERFALL_DROPLET_FORCE
+from dambuilder.view import coord, conv, player_view
+from dambuilder.waterlevel import Waterlevel
+from dambuilder.constants import (WATERFALL_COLOR, WATERFALL_DROPLET_FORCE,
+                                  GRAVITY)
+
+# size of a droplet
+DROPLET_RADIUS = 0.06
+DROPLET_DENSITY = 0.2
+DROPLET_MASS = DROPLET_DENSITY * 4. / 3. * math.pi * DROPLET_RADIUS ** 3
+
+# droplets a waterfall adds for each unit of its flow rate
+DROPLETS_PER_RATE = 200
+# maximum amount of droplets a single waterfall shows
+MAX_DROPLETS = 20
+# maximum amount of droplets all waterfalls together show
+MAX_TOTAL_DROPLETS = 200
+# share of droplets of a waterfall that can't be seen, compared to one
+# that can
+HIDDEN_DROPLET_WEIGHT = 0.1
 
 class Waterfall(object):
-    def __init__(self, amount, disappear_height,
+    """Adds droplets to particles where water flows out.
+
+    Several waterfalls can share the same particles, which are stepped
+    and rendered by their owner.
+    """
+
+    def __init__(self, particles, amount, disappear_height,
                  disappear_always_height, xs, xe, y):
         self.amount = amount
-        self.disappear_height = disappear_height
+        # droplets disappear below this level, which follows the water
+        self.disappear_level = Waterlevel('none', disappear_height)
         self.disappear_always_height = disappear_always_height
         self.xs = xs
         self.xe = xe
         self.x = xs
         self.dir = -1
         self.y = y
-        self._droplets = []
-
-    def clear_ode(self):
-        for droplet in self._droplets:
-            ode_space.remove(droplet.geom)
+        # amount of droplets of this waterfall
+        self.count = 0
+        # amount of droplets allowed by the droplet budget, if any
+        self.budget = None
+        self._particles = particles
 
-    def cleanup(self):
-        """Remove any objects below disappearing height.
+    def add(self, stepsize):
+        """Add new droplet at starting point if necessary.
         """
-        new_droplets = []
-        h = self.disappear_height
-        for droplet in self._droplets:
-            geom = droplet.geom
-            x, y, z = geom.getPosition()
-            if y > h and y > self.disappear_always_height:
-                new_droplets.append(droplet)
-            else:
-                ode_space.remove(geom)
-        self._droplets = new_droplets
+        if self.y < self.disappear_level.level:
+            return
 
-    def add(self):
-        """Add new object at starting point if necessary.
-        """
-        if self.y < self.disappear_height:
+        if self.count >= self.amount or self.count > MAX_DROPLETS:
             return
 
-        if len(self._droplets) >= self.amount or len(self._droplets) > 20:
+        if self.budget is not None and self.count >= self.budget:
             return
 
-        geom = physbody.Ball(0.2, 0.06, self.x, self.y)
-        droplet = Droplet(geom)
-        geom.getBody().setForce((WATERFALL_DROPLET_FORCE * self.dir, 0, 0))
-        self._droplets.append(droplet)
+        # droplets are pushed out during their first step
+        vx = WATERFALL_DROPLET_FORCE * self.dir / DROPLET_MASS * stepsize
+        self._particles.add(self, self.x, self.y, vx)
 
     def update_flow(self, rate, level, prev_level):
-        self.amount = int(rate * 200)
+        self.amount = int(rate * DROPLETS_PER_RATE)
         if prev_level.level > level.level:
-            self.disappear_height = level.level
+            self.disappear_level = level
             self.direction = 1
             self.x = self.xe
         else:
-            self.disappear_height = prev_level.level
+            self.disappear_level = prev_level
             self.direction = -1
             self.x = self.xs
             
     def cut_flow(self):
         self.amount = 0
-        
-    def update(self):
+
+    def is_empty(self):
+        return self.amount == 0 and not self.count
+
+    def is_visible(self):
+        view = player_view
+        return (self.xe >= view.origin_x and
+                self.xs <= view.origin_x + view.width and
+                self.y >= view.origin_y and
+                self.disappear_level.level <= view.origin_y + view.height)
+
+
+class DropletBudget(object):
+    """Divides a maximum amount of droplets over all waterfalls.
+
+    Each waterfall gets a share in proportion to its flow, and a smaller
+    one when it can't be seen. When there are many waterfalls they each
+    show fewer droplets, instead of slowing down the game.
+    """
+
+    def __init__(self, total=MAX_TOTAL_DROPLETS):
+        self.total = total
+        self._allocation = []
+
+    def allocate(self, waterfalls):
+        weights = []
+        for waterfall in waterfalls:
+            weight = float(waterfall.amount)
+            if not waterfall.is_visible():
+                weight *= HIDDEN_DROPLET_WEIGHT
+            weights.append(weight)
+        total_weight = sum(weights)
+        allocation = []
+        for waterfall, weight in zip(waterfalls, weights):
+            if total_weight > 0.:
+                budget = int(self.total * weight / total_weight)
+            else:
+                budget = 0
+            waterfall.budget = budget
+            allocation.append((waterfall, budget))
+        self._allocation = allocation
+
+    def get_allocation(self):
+        """Return (waterfall, droplets) for all waterfalls as last
+        allocated.
+        """
+        return self._allocation
+
+class Particles(object):
+    """Droplets, with their positions and velocities kept in flat lists.
+
+    Droplets don't collide with anything, they just fall until they
+    reach the water of the waterfall they came from.
+    """
+
+    def __init__(self):
+        self.xs = []
+        self.ys = []
+        self.vxs = []
+        self.vys = []
+        # the waterfall each droplet came from
+        self.waterfalls = []
+
+    def update(self, stepsize):
+        self.step(stepsize)
         self.cleanup()
-        self.add()
 
-    def render(self, screen):
-        for droplet in self._droplets:
-            droplet.render(screen)
+    def add(self, waterfall, x, y, vx):
+        self.xs.append(x)
+        self.ys.append(y)
+        self.vxs.append(vx)
+        self.vys.append(0.)
+        self.waterfalls.append(waterfall)
+        waterfall.count += 1
 
-class Droplet(object):
-    def __init__(self, geom):
-        self.geom = geom
+    def step(self, stepsize):
+        xs = self.xs
+        ys = self.ys
+        vxs = self.vxs
+        vys = self.vys
+        dv = GRAVITY * stepsize
+        for i in range(len(xs)):
+            vys[i] += dv
+            xs[i] += vxs[i] * stepsize
+            ys[i] += vys[i] * stepsize
+
+    def cleanup(self):
+        """Remove any droplets below disappearing height.
+        """
+        keep = []
+        for y, waterfall in zip(self.ys, self.waterfalls):
+            if (y > waterfall.disappear_level.level and
+                y > waterfall.disappear_always_height):
+                keep.append(True)
+            else:
+                keep.append(False)
+                waterfall.count -= 1
+        if False not in keep:
+            return
+        self.xs = compress(self.xs, keep)
+        self.ys = compress(self.ys, keep)
+        self.vxs = compress(self.vxs, keep)
+        self.vys = compress(self.vys, keep)
+        self.waterfalls = compress(self.waterfalls, keep)
 
     def render(self, screen):
-        x, y, dummy = self.geom.getPosition()
-        r = self.geom.getRadius()
-        pygame.draw.circle(screen, WATERFALL_COLOR, coord(x, y),
-                           conv(r * 4), 0)
+        sprite = droplet_sprite.get()
+        r = sprite.get_width() // 2
+        positions = []
+        for x, y in zip(self.xs, self.ys):
+            x, y = coord(x, y)
+            positions.append((sprite, (x - r, y - r)))
+        blits = getattr(screen, 'blits', None)
+        if blits is not None:
+            blits(positions, False)
+        else:
+            # older pygame
+            for sprite, position in positions:
+                screen.blit(sprite, position)
+
+def compress(values, keep):
+    return [value for value, k in zip(values, keep) if k]
+
+class DropletSprite(object):
+    """A droplet, rendered once.
+    """
+
+    def __init__(self):
+        self._sprite = None
+
+    def get(self):
+        if self._sprite is not None:
+            return self._sprite
+        colorkey = (0, 255, 0)
+        r = conv(DROPLET_RADIUS * 4)
+        sprite = pygame.Surface((2 * r + 1, 2 * r + 1))
+        sprite.fill(colorkey)
+        sprite.set_colorkey(colorkey)
+        pygame.draw.circle(sprite, WATERFALL_COLOR, (r, r), r, 0)
+        self._sprite = sprite
+        return sprite
+
+droplet_sprite = DropletSprite()
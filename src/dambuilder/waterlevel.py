@@ -1,4 +1,16 @@
 
+# integrators for the water world
+EXPLICIT = 'explicit'
+IMPLICIT = 'implicit'
+
+# smallest level difference used to linearize a connection
+EPSILON = 1e-6
+# times the implicit integrator refines its linearization per step
+ITERATIONS = 4
+# step size and maximum time in seconds for predictions
+PREDICTION_STRIDE = 5.
+PREDICTION_HORIZON = 600.
+
 class Waterlevel(object):
     """A water level has several inputs."""
 
@@ -18,7 +30,8 @@ class WaterlevelError(Exception):
     pass
 
 class World(object):
-    def __init__(self):
+    def __init__(self, integrator=EXPLICIT):
+        self.integrator = integrator
         self._levels = {}
         self._connections = {}
         self._flows_into = {}
@@ -51,17 +64,184 @@ class World(object):
 
     def get_level(self, level_id):
         return self._levels[level_id]
+
+    def get_levels(self):
+        return list(self._levels.values())
     
     def get_connection(self, connection_id):
         return self._connections[connection_id]
+
+    def get_connections(self):
+        return list(self._connections.values())
     
     def have_connection(self, connection_id):
         return connection_id in self._connections
     
     def step(self, stepsize):
+        if self.integrator == IMPLICIT:
+            self.step_implicit(stepsize)
+        else:
+            self.step_explicit(stepsize)
+
+    def step_explicit(self, stepsize):
         for connection in self._connections.values():
             connection.step(stepsize, self)
 
+    def step_implicit(self, stepsize):
+        """Step all levels at once with a semi-implicit integrator.
+
+        This stays stable for large steps and doesn't depend on the
+        order of the connections.
+        """
+        heights = {}
+        for id, level in self._levels.items():
+            heights[id] = level.level
+        heights = integrate_implicit(heights, self.get_flows(), stepsize)
+        for id, height in heights.items():
+            if height is not None:
+                self._levels[id].level = height
+
+    def predict_crossing(self, level_id, threshold,
+                         stride=PREDICTION_STRIDE,
+                         horizon=PREDICTION_HORIZON):
+        """Predict in how many seconds level_id will exceed threshold.
+
+        The current connections are projected forward in large implicit
+        steps, without changing the world. Returns None if the level
+        won't exceed threshold within horizon seconds.
+        """
+        heights = {}
+        for id, level in self._levels.items():
+            heights[id] = level.level
+        current = heights[level_id]
+        if current > threshold:
+            return 0.
+        flows = self.get_flows()
+        t = 0.
+        while t < horizon:
+            heights = integrate_implicit(heights, flows, stride)
+            projected = heights[level_id]
+            if projected > threshold:
+                # interpolate within the last stride
+                return t + stride * (threshold - current) / (
+                    projected - current)
+            current = projected
+            t += stride
+        return None
+
+    def get_flows(self):
+        """Return (source_id, target_id, rate, minimum_level) for all
+        connections.
+        """
+        return [(connection.source_id, connection.target_id,
+                 connection.rate, connection.minimum_level)
+                for connection in self._connections.values()]
+
+def integrate_implicit(heights, flows, stepsize):
+    """Integrate heights over stepsize, returning the new heights.
+
+    heights maps level id to level, or None for sources. flows is a
+    list of (source_id, target_id, rate, minimum_level).
+
+    Each connection is linearized as a conductance that gives its rate
+    at the level difference at the end of the step, and the linear
+    system for the levels at the end of the step is solved (backward
+    Euler). This is repeated a few times to refine the conductances.
+    The resulting flows are clamped to what the explicit model allows
+    and then applied to the original heights, so no water is created
+    or lost.
+    """
+    ids = [id for id, height in heights.items() if height is not None]
+    indexes = {}
+    for i, id in enumerate(ids):
+        indexes[id] = i
+    n = len(ids)
+    inflow = [0.] * n
+    connections = []
+    for source_id, target_id, rate, minimum_level in flows:
+        t = indexes[target_id]
+        if heights[source_id] is None:
+            # a source keeps flowing at its rate
+            inflow[t] += rate * stepsize
+            continue
+        s = indexes[source_id]
+        connections.append((s, t, rate * stepsize, minimum_level))
+    differences = [abs(heights[ids[s]] - heights[ids[t]])
+                   for s, t, amount, minimum_level in connections]
+
+    for iteration in range(ITERATIONS):
+        matrix = [[0.] * n for i in range(n)]
+        vector = [heights[id] + inflow[i] for i, id in enumerate(ids)]
+        for i in range(n):
+            matrix[i][i] = 1.
+        couplings = []
+        for (s, t, amount, minimum_level), difference in zip(connections,
+                                                             differences):
+            coupling = amount / max(difference, EPSILON)
+            matrix[s][s] += coupling
+            matrix[t][t] += coupling
+            matrix[s][t] -= coupling
+            matrix[t][s] -= coupling
+            couplings.append(coupling)
+        solution = _solve(matrix, vector)
+        differences = [abs(solution[s] - solution[t])
+                       for s, t, amount, minimum_level in connections]
+
+    result = dict(heights)
+    for i, id in enumerate(ids):
+        result[id] += inflow[i]
+    # source -> [(minimum_level, target, amount)] of its outflows
+    outflows = {}
+    for (s, t, maximum, minimum_level), coupling in zip(connections,
+                                                        couplings):
+        amount = coupling * (solution[s] - solution[t])
+        if amount < 0.:
+            s, t = t, s
+            amount = -amount
+        # never flow faster than the rate
+        amount = min(amount, maximum)
+        outflows.setdefault(s, []).append((minimum_level, t, amount))
+    # the outflows of a source share what's above their minimum levels,
+    # with those with the highest minimum level cut off first
+    for s, flows in outflows.items():
+        flows.sort()
+        flows.reverse()
+        available = heights[ids[s]] + inflow[s]
+        drained = 0.
+        for minimum_level, t, amount in flows:
+            amount = min(amount, max(available - minimum_level - drained,
+                                     0.))
+            drained += amount
+            result[ids[s]] -= amount
+            result[ids[t]] += amount
+    return result
+
+def _solve(matrix, vector):
+    """Solve matrix * x = vector with Gaussian elimination.
+    """
+    n = len(vector)
+    for i in range(n):
+        pivot = i
+        for j in range(i + 1, n):
+            if abs(matrix[j][i]) > abs(matrix[pivot][i]):
+                pivot = j
+        matrix[i], matrix[pivot] = matrix[pivot], matrix[i]
+        vector[i], vector[pivot] = vector[pivot], vector[i]
+        for j in range(i + 1, n):
+            factor = matrix[j][i] / matrix[i][i]
+            if factor == 0.:
+                continue
+            for k in range(i, n):
+                matrix[j][k] -= factor * matrix[i][k]
+            vector[j] -= factor * vector[i]
+    solution = [0.] * n
+    for i in range(n - 1, -1, -1):
+        total = vector[i]
+        for k in range(i + 1, n):
+            total -= matrix[i][k] * solution[k]
+        solution[i] = total / matrix[i][i]
+    return solution
+
 class Connection(object):
     def __init__(self, id, source_id, target_id, rate, minimum_level):
         self.id = id
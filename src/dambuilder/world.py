@@ -1,3 +1,4 @@
+import math
 import random
 
 import ode
@@ -6,38 +7,68 @@ import pygame
 from pygame.locals import *
 
 from dambuilder import waterlevel
+from dambuilder import waterfall
 from dambuilder import fonts
 from dambuilder.load import load, main_path
 from dambuilder.dam import DamSentinel, Dam
 from dambuilder.beaver import Beaver
 from dambuilder.fish import Fish, DangerFish
 from dambuilder.bird import Bird
-from dambuilder.item import random_item
+from dambuilder.item import Item, FloatingItems, random_item
 from dambuilder.material import SECTION_HEIGHT
-from dambuilder.physbody import (ode_world, ode_space, contactgroup,
-                                 Ball, Immovable)
+from dambuilder.pool import Pool
+from dambuilder.entities import Registry
+from dambuilder.clock import SimulationClock
+from dambuilder.rng import RandomStreams
+from dambuilder import physbody
+from dambuilder.physbody import (ode_world, static_space, contactgroup,
+                                 Immovable, set_category,
+                                 acquire_ball, release_ball,
+                                 CollisionDispatcher,
+                                 BEAVER, CREATURE, STATIC, RIGHTMOST)
 from dambuilder.view import coord, conv, player_view
 from dambuilder.constants import (WATER_COLOR, DISPLAY_COLOR, TEXT_COLOR,
-                                  MAX_X, MAX_ITEMS, MAX_LIVINGS, GRAVITY,)
+                                  MAX_X, MAX_ITEMS, MAX_LIVINGS, GRAVITY,
+                                  GAME_OVER_LEVEL, ACTIVITY_MARGIN,
+                                  DORMANT_SPEED,
+                                  AUTO_DISABLE_LINEAR_THRESHOLD,
+                                  AUTO_DISABLE_ANGULAR_THRESHOLD,
+                                  AUTO_DISABLE_STEPS)
 
 class WorldError(Exception):
     pass
 
 class World(object):
+
+    # whether waterfalls show droplets. Droplets don't affect the game,
+    # so a world that isn't rendered can do without them.
+    droplets = True
     
-    def __init__(self):
+    def __init__(self, water_world_class=waterlevel.World,
+                 integrator=waterlevel.EXPLICIT, seed=None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        elif not 0 <= seed < 2 ** 32:
+            # seeds are saved in recordings and snapshots as 32 bits
+            raise WorldError("Seed out of range: %s" % seed)
+        # all randomness in the world comes from these
+        self.rng = RandomStreams(seed)
         # the dams in the world
         self._dams = []
+        # simulated time, which times everything in the world
+        self.clock = SimulationClock()
         # items
-        self._items = []
+        self._items = Registry()
+        # the items floating in water, which aren't ODE bodies
+        self._floating_items = FloatingItems()
         # livings
-        self._livings = []
+        self._livings = Registry()
 
         # maintain list for ode world cleanup
         self._ode_objects = []
       
         # part of the world that manages water levels
-        self._water_world = waterlevel.World()
+        self._water_world = water_world_class(integrator)
  
         # the initial water level of the whole world
         start_level = self._water_world.add_level('start', 0)
@@ -45,27 +76,38 @@ class World(object):
         # start dam sentinel
         self._start_dam = DamSentinel(start_level)
 
+        # divides droplets over all waterfalls
+        self._droplet_budget = waterfall.DropletBudget()
+
         # start off with 1 animal
         self._last_difficulty = -1
         
     def setup(self):
         # set gravity
         ode_world.setGravity((0, GRAVITY, 0))
+
+        # let ODE disable bodies that come to rest
+        ode_world.setAutoDisableFlag(True)
+        ode_world.setAutoDisableLinearThreshold(AUTO_DISABLE_LINEAR_THRESHOLD)
+        ode_world.setAutoDisableAngularThreshold(
+            AUTO_DISABLE_ANGULAR_THRESHOLD)
+        ode_world.setAutoDisableSteps(AUTO_DISABLE_STEPS)
         
         # floor at the bottom
-        floor = ode.GeomPlane(ode_space, (0, 1, 0), 0)
+        floor = ode.GeomPlane(static_space, (0, 1, 0), 0)
+        set_category(floor, STATIC)
         self._ode_objects.append(floor)
         
         # the leftmost end of the game
-        leftmost = ode.GeomPlane(ode_space, (1, 0, 0), 0)
+        leftmost = ode.GeomPlane(static_space, (1, 0, 0), 0)
+        set_category(leftmost, STATIC)
         self._ode_objects.append(leftmost)
         
-        # immovable geom at the right end
+        # immovable geom at the right end, only the beaver bumps into it
         # XXX make it vastly huge so we can't go over it...
         self.rightmost_geom = Immovable(
             MAX_X, 50000.,
-            1., 100000.)
-        self.rightmost_geom.rightmost = True
+            1., 100000., RIGHTMOST)
         self._ode_objects.append(self.rightmost_geom)
         
         # a physical dam object in ode
@@ -83,49 +125,105 @@ class World(object):
         water_world.connect('warming', icecaps, sea, 0.07)
 
         # beaver
-        beaver_geom = Ball(1.2, 0.5, 0.5, 0.5)
-        b = Beaver(beaver_geom)
+        beaver_geom = acquire_ball(1.2, 0.5, 0.5, 0.5, BEAVER)
+        b = Beaver(beaver_geom, self.clock)
         self.add_living(b)
+        self.flush_entities()
 
     def clear_ode(self):
         for dam in self._dams:
             dam.clear_ode()
         for obj in self._ode_objects:
-            ode_space.remove(obj)
+            physbody.remove(obj)
+        # keep the balls around for the next game
         for item in self._items:
-            ode_space.remove(item.geom)
+            if item.geom is not None:
+                release_ball(item.geom)
         for living in self._livings:
-            ode_space.remove(living.geom)
+            release_ball(living.geom)
+            # and the fish and birds; the next game makes its own beaver
+            if not isinstance(living, Beaver):
+                living_pool.release(type(living), living)
             
     def step(self, stepsize):
         """Update world.
         """
         if ode_world is not None:
-            ode_space.collide((ode_world, contactgroup),
-                              collision_callback)
+            physbody.collide((ode_world, contactgroup), collision_callback)
             ode_world.step(stepsize)
             contactgroup.empty()
+            self.update_dormancy()
 
         self.step_water(stepsize)
 
         self.step_erosion(stepsize)
         
         self.step_items(stepsize)
+
+        self.step_floating_items(stepsize)
         
         for item in self._items:
-            item.step(stepsize, self)
-            item.clear_collisions()
+            # floating items were moved by step_floating_items
+            if item.geom is not None and not item.dormant:
+                item.step(stepsize, self)
 
         for living in self._livings:            
-            living.step(stepsize, self)
-            living.clear_collisions()
+            if not living.dormant:
+                living.step(stepsize, self)
 
         # potentially increase difficulty
         self.increase_difficulty()
+
+        self.flush_entities()
+
+        self.clock.advance(stepsize)
         
+    def update_dormancy(self):
+        """Put items and livings far away from the view to sleep, and
+        wake up those that came near or were bumped into.
+
+        Only those that have settled down can go to sleep: not those
+        still coming into the playing field from the right, or falling
+        or drifting along, as they may be on their way to the beaver.
+        Items that the water reaches wake up, to drift along with it.
+        """
+        x = player_view.origin_x + player_view.halfway_x
+        y = player_view.origin_y + player_view.halfway_y
+        radius = (math.hypot(player_view.halfway_x, player_view.halfway_y) +
+                  ACTIVITY_MARGIN)
+        radius_squared = radius * radius
+        speed_squared = DORMANT_SPEED * DORMANT_SPEED
+        for objects, drifting in ((self._items, True),
+                                  (self._livings, False)):
+            for obj in objects:
+                if not obj.can_sleep or obj.geom is None:
+                    continue
+                obj_x, obj_y, dummy = obj.geom.getPosition()
+                far = ((obj_x - x) * (obj_x - x) +
+                       (obj_y - y) * (obj_y - y)) > radius_squared
+                in_water = (drifting and
+                            obj_y < self.get_waterlevel(obj_x).level)
+                body = obj.geom.getBody()
+                if obj.dormant:
+                    # ODE enables bodies when something bumps into them
+                    if not far or in_water or body.isEnabled():
+                        obj.wake()
+                elif far and not in_water and obj_x <= MAX_X:
+                    vx, vy, dummy = body.getLinearVel()
+                    if vx * vx + vy * vy <= speed_squared:
+                        obj.sleep()
+
     def step_water(self, stepsize):
         for dam in self._dams:
-            dam.update(self)
+            dam.update_flow(self)
+        if self.droplets:
+            # droplets are divided over the waterfalls as they flow now
+            waterfalls = []
+            for dam in self._dams:
+                waterfalls.extend(dam.get_waterfalls())
+            self._droplet_budget.allocate(waterfalls)
+            for dam in self._dams:
+                dam.update_waterfalls(stepsize)
         self._water_world.step(stepsize)
 
     def step_erosion(self, stepsize):
@@ -146,13 +244,31 @@ class World(object):
         if item_chance > 1.:
             item_chance = 1.0
         item_chance *= stepsize * 10
-        if random.random() < item_chance:
-            y = random.random() * sea_level + 0.5
-            item_class = random_item()
-            item = item_class(MAX_X + player_view.width / 2., y)
-            item.geom.getBody().addForce((-20, 0, 0))
+        rng = self.rng.items
+        if rng.random() < item_chance:
+            y = rng.random() * sea_level + 0.5
+            item_class = random_item(rng)
+            item = item_pool.acquire(item_class)
+            if item is None:
+                item = item_class()
+            x = MAX_X + player_view.width / 2.
+            # the push to the left we get on the next step
+            vx = -20. / item.get_mass() * stepsize
+            if y < sea_level:
+                self._floating_items.add(item, x, y, vx, 0.)
+            else:
+                item.promote(x, y, vx, 0.)
             self.add_item(item)
 
+    def step_floating_items(self, stepsize):
+        self._floating_items.step(stepsize, self)
+        # XXX hacky way to get the beaver
+        beaver = self._livings[0]
+        x, y, dummy = beaver.geom.getPosition()
+        radius = beaver.geom.getRadius()
+        for item in self._floating_items.touching(x, y, radius):
+            collisions.dispatch(beaver, item)
+
     def increase_difficulty(self):
         """Increases difficulty as water level gets higher.
         """
@@ -162,7 +278,7 @@ class World(object):
         difficulty = int(height / 3)
         if self._last_difficulty == difficulty:
             return
-        if random.random() < 0.5:
+        if self.rng.difficulty.random() < 0.5:
             self.add_fish(height)
         else:
             self.add_bird(height)
@@ -170,13 +286,19 @@ class World(object):
 
     def is_game_over(self):
         height = self._water_world.get_level('start').level
-        return height > 10.
+        return height > GAME_OVER_LEVEL
+
+    def time_to_flood(self):
+        """Predicted seconds until the game is over, or None if that
+        won't happen soon with the current leaks and flooding.
+        """
+        return self._water_world.predict_crossing('start', GAME_OVER_LEVEL)
 
     def add_bird(self, height):
         dummy, y, dummy = self._livings[0].geom.getPosition()
-        bird_geom = Ball(0.2, 0.5, 3, y + player_view.height)
-        bird = Bird(bird_geom)
-        self.add_living(bird)
+        bird_geom = acquire_ball(Bird.density, Bird.radius,
+                                 3, y + player_view.height, CREATURE)
+        self.add_living(self.reuse_living(Bird, bird_geom))
 
     def add_fish(self, height):
         if height > 28.:
@@ -185,9 +307,19 @@ class World(object):
             fish_class = Fish
         dam = self._dams[0]
         x, y, dummy = self._livings[0].geom.getPosition()
-        fish_geom = Ball(0.4, 0.5, dam.start_x + 14, dam.height / 2.)
-        fish = fish_class(fish_geom)
-        self.add_living(fish)
+        fish_geom = acquire_ball(fish_class.density, fish_class.radius,
+                                 dam.start_x + 14, dam.height / 2.,
+                                 CREATURE)
+        self.add_living(self.reuse_living(fish_class, fish_geom))
+
+    def reuse_living(self, living_class, geom):
+        """Get a released living of living_class, or make a new one.
+        """
+        living = living_pool.acquire(living_class)
+        if living is None:
+            return living_class(geom, self.clock)
+        living.reset(geom, self.clock)
+        return living
     
     def add_dam(self, id, geom):
         """Build a dam for geom.
@@ -206,29 +338,63 @@ class World(object):
         return dam
 
     def add_item(self, item):
-        self._items.append(item)
+        """Add item to the world at the end of this step.
+        """
+        self._items.add(item)
 
     def remove_item(self, item):
-        item.geom.obj = None # XXX break cycles
-        ode_space.remove(item.geom)
-        i = self._items.index(item)
-        # means we cannot call this while looping through items, such
-        # as in item.step
-        del self._items[i]
+        """Remove item from the world at the end of this step.
+
+        Returns False if the item was already removed this step.
+        """
+        return self._items.remove(item)
         
     def add_living(self, living):
-        self._livings.append(living)
+        """Add living to the world at the end of this step.
+        """
+        self._livings.add(living)
 
     def remove_living(self, living):
-        living.geom.obj = None # break cycles
-        ode_space.remove(living.geom)
-        i = self._livings.index(living)
-        # means we cannot call this while looping through livings, such
-        # as inside living update
-        del self._livings[i]
+        """Remove living from the world at the end of this step.
+        """
+        self._livings.remove(living)
+
+    def flush_entities(self):
+        """Carry out the adds and removes queued since the last flush.
+        """
+        for item in self._items.flush():
+            if item.floating is not None:
+                item.floating.remove(item)
+            else:
+                item.remove_geom()
+            item_pool.release(type(item), item)
+        for living in self._livings.flush():
+            release_ball(living.geom)
+            living_pool.release(type(living), living)
+
+    def get_item(self, handle):
+        return self._items.get(handle)
+
+    def get_living(self, handle):
+        return self._livings.get(handle)
         
     def get_water_world(self):
         return self._water_world
+
+    def get_items(self):
+        return self._items
+
+    def get_livings(self):
+        return self._livings
+
+    def get_dams(self):
+        return self._dams
+
+    def get_floating_items(self):
+        return self._floating_items
+
+    def get_droplet_budget(self):
+        return self._droplet_budget
     
     def get_dam(self, x):
         for dam in self._dams:
@@ -315,20 +481,23 @@ class World(object):
 
         self.render_info(screen)
         
+# removed items and livings, reused for new ones by their class
+item_pool = Pool()
+living_pool = Pool()
+
+# what happens when objects collide
+collisions = CollisionDispatcher()
+collisions.register(Beaver, Item, Beaver.touch_item)
+collisions.register(Fish, Beaver, Fish.flee_from)
+collisions.register(Bird, Beaver, Bird.flee_from)
+
 def collision_callback(args, geom1, geom2):
     """Callback function for the collide() method.
 
     This function checks if the given geoms do collide and
-    creates contact joints if they do.
+    creates contact joints if they do. Pairs that shouldn't collide
+    are already filtered out by ODE using the collision categories.
     """
-    # don't collide rightmost object with anything that's not the beaver
-    if getattr(geom1, 'rightmost', None) or getattr(geom2, 'rightmost', None):
-        obj1 = getattr(geom1, 'obj', None)
-        obj2 = getattr(geom2, 'obj', None)
-        if not (isinstance(obj1, Beaver) or
-                isinstance(obj2, Beaver)):
-            return
-        
     # check if the objects do collide
     contacts = ode.collide(geom1, geom2)
 
@@ -336,8 +505,7 @@ def collision_callback(args, geom1, geom2):
         obj1 = getattr(geom1, 'obj', None)
         obj2 = getattr(geom2, 'obj', None)
         if obj1 is not None and obj2 is not None:
-            obj1.add_collision(obj2)
-            obj2.add_collision(obj1)
+            collisions.dispatch(obj1, obj2)
                 
     # create contact joints
     ode_world, contactgroup = args